@@ -0,0 +1,296 @@
+import asyncio
+import csv
+import json
+import sys
+from argparse import Namespace
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# Appended, like in generate_qr_code/main.py, for the logger shared with the booth
+sys.path.append(str(Path(__file__).resolve().parent.parent / "booth_main" / "src"))
+
+from utils import log_error, log_info
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 7788
+DEFAULT_BATCH_SIZE = 500
+DEFAULT_FLUSH_INTERVAL_SECS = 10.0
+# Keys of recently accepted rows, used to drop batches a booth resends
+DEDUP_CAPACITY = 100_000
+MAX_MESSAGE_BYTES = 16 * 1024 * 1024
+
+AUTHORIZED_PATH = "./token_cache.json"
+CREDENTIALS_PATH = "./credentials.json"
+SCOPES = ["https://www.googleapis.com/auth/spreadsheets"]
+
+# Same column order as booth_main/src/spreadsheet.py
+ROW_FIELDS = [
+    "name",
+    "address",
+    "contact_number",
+    "room_id",
+    "temperature",
+    "time_detected",
+]
+
+RowKey = Tuple[str, ...]
+
+
+class InvalidMessage(Exception):
+    def __init__(self, reason: str):
+        self._reason = reason
+
+    def __str__(self):
+        return f"Invalid message: {self._reason}"
+
+
+class GspreadSheet:
+    def __init__(self, spreadsheet_id: str):
+        import gspread
+
+        client = gspread.oauth(
+            scopes=SCOPES,
+            credentials_filename=CREDENTIALS_PATH,
+            authorized_user_filename=AUTHORIZED_PATH,
+        )
+        self._worksheet = client.open_by_key(spreadsheet_id).get_worksheet(0)
+
+    def append_rows(self, rows: List[List[str]]) -> None:
+        self._worksheet.append_rows(rows)
+
+
+class FakeSheet:
+    def __init__(self, path: Optional[Path] = None):
+        self._path = path
+        self.rows: List[List[str]] = []
+        self.n_calls = 0
+
+    def append_rows(self, rows: List[List[str]]) -> None:
+        self.n_calls += 1
+        self.rows.extend(rows)
+
+        if self._path is not None:
+            with open(self._path, "a", newline="") as file:
+                csv.writer(file).writerows(rows)
+
+
+class Aggregator:
+    def __init__(
+        self,
+        sheet: Any,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_interval_secs: float = DEFAULT_FLUSH_INTERVAL_SECS,
+    ):
+        self._sheet = sheet
+        self._batch_size = batch_size
+        self._flush_interval_secs = flush_interval_secs
+        self._pending: List[Tuple[RowKey, List[str]]] = []
+        self._waiters: List[asyncio.Future] = []
+        self._seen: OrderedDict[RowKey, None] = OrderedDict()
+        self._flush_lock = asyncio.Lock()
+
+        self.n_received = 0
+        self.n_duplicates = 0
+        self.n_written = 0
+        self.n_api_calls = 0
+
+    async def submit(self, booth_id: str, records: List[Dict[str, Any]]) -> None:
+        # Queues the records and returns once they are written to the sheet
+        rows = [_record_to_row(record) for record in records]
+
+        for row in rows:
+            self.n_received += 1
+            key = (booth_id, *row)
+
+            if key in self._seen:
+                self.n_duplicates += 1
+                continue
+
+            self._seen[key] = None
+
+            if len(self._seen) > DEDUP_CAPACITY:
+                self._seen.popitem(last=False)
+
+            self._pending.append((key, row))
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+
+        if len(self._pending) >= self._batch_size:
+            asyncio.create_task(self.flush())
+
+        await waiter
+
+    async def flush(self) -> None:
+        async with self._flush_lock:
+            pending = self._pending
+            waiters = self._waiters
+            self._pending = []
+            self._waiters = []
+
+            if len(pending) > 0:
+                # Rows are ordered by time_detected across every booth in the batch
+                pending.sort(key=lambda key_row: key_row[1][-1])
+                rows = [row for _, row in pending]
+
+                try:
+                    await asyncio.get_running_loop().run_in_executor(
+                        None, self._sheet.append_rows, rows
+                    )
+                except Exception as error:
+                    log_error(f"Failed to append {len(rows)} rows: {error}")
+
+                    # Let the booths' retries through instead of dropping them as duplicates
+                    for key, _ in pending:
+                        self._seen.pop(key, None)
+
+                    for waiter in waiters:
+                        if not waiter.done():
+                            waiter.set_exception(error)
+                    return
+
+                self.n_written += len(rows)
+                self.n_api_calls += 1
+                log_info(f"Appended {len(rows)} rows in one call")
+
+            for waiter in waiters:
+                if not waiter.done():
+                    waiter.set_result(None)
+
+    async def run_periodic_flush(self) -> None:
+        while True:
+            await asyncio.sleep(self._flush_interval_secs)
+            await self.flush()
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        peer = writer.get_extra_info("peername")
+        log_info(f"Booth connected from {peer}")
+
+        try:
+            while True:
+                line = await reader.readline()
+
+                if line == b"":
+                    break
+
+                reply = await self._handle_message(line)
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+        except (ConnectionError, asyncio.LimitOverrunError, ValueError) as error:
+            log_error(f"Dropping connection from {peer}: {error}")
+        finally:
+            writer.close()
+            log_info(f"Booth disconnected from {peer}")
+
+    async def _handle_message(self, line: bytes) -> Dict[str, Any]:
+        batch_id = None
+
+        try:
+            message = json.loads(line)
+
+            if not isinstance(message, dict):
+                raise InvalidMessage("expected an object")
+
+            batch_id = message.get("batch_id")
+            booth_id = message["booth_id"]
+            records = message["persons"]
+
+            if not isinstance(records, list):
+                raise InvalidMessage("`persons` must be a list")
+
+            await self.submit(str(booth_id), records)
+        except (ValueError, KeyError, TypeError, InvalidMessage) as error:
+            return {"batch_id": batch_id, "error": f"Invalid message: {error!r}"}
+        except Exception as error:
+            return {"batch_id": batch_id, "error": str(error)}
+
+        return {"batch_id": batch_id, "ack": True}
+
+
+def _record_to_row(record: Dict[str, Any]) -> List[str]:
+    if not isinstance(record, dict):
+        raise InvalidMessage("each person must be an object")
+
+    return [str(record[field]) for field in ROW_FIELDS]
+
+
+async def serve(aggregator: Aggregator, host: str, port: int) -> None:
+    server = await asyncio.start_server(
+        aggregator.handle_connection, host, port, limit=MAX_MESSAGE_BYTES
+    )
+    log_info(f"Aggregating booth check-ins on {host}:{port}")
+
+    async with server:
+        flush_task = asyncio.create_task(aggregator.run_periodic_flush())
+
+        try:
+            await server.serve_forever()
+        finally:
+            flush_task.cancel()
+            await aggregator.flush()
+
+
+def main(args: Namespace) -> int:
+    if args.fake_sheet is not None:
+        sheet: Any = FakeSheet(args.fake_sheet)
+        log_info(f"Writing rows to fake sheet `{args.fake_sheet.resolve()}`")
+    elif args.spreadsheet_id is not None:
+        sheet = GspreadSheet(args.spreadsheet_id)
+    else:
+        log_error("Either --spreadsheet-id or --fake-sheet is required")
+        return 1
+
+    aggregator = Aggregator(sheet, args.batch_size, args.flush_interval_secs)
+
+    try:
+        asyncio.run(serve(aggregator, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+    log_info(
+        f"Received {aggregator.n_received} rows ({aggregator.n_duplicates} duplicates); "
+        f"wrote {aggregator.n_written} in {aggregator.n_api_calls} API calls"
+    )
+
+    return 0
+
+
+def parse_args() -> Namespace:
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description="Collect check-ins from many booths and append them to the "
+        "spreadsheet in large batches"
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on")
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT, help="Port to listen on"
+    )
+    parser.add_argument(
+        "--spreadsheet-id", help="Google Sheets spreadsheet to append to"
+    )
+    parser.add_argument(
+        "--fake-sheet",
+        type=Path,
+        help="Append rows to this CSV file instead of Google Sheets, for testing",
+    )
+    parser.add_argument(
+        "--batch-size",
+        type=int,
+        default=DEFAULT_BATCH_SIZE,
+        help="Rows that trigger a write before the flush interval elapses",
+    )
+    parser.add_argument(
+        "--flush-interval-secs",
+        type=float,
+        default=DEFAULT_FLUSH_INTERVAL_SECS,
+        help="Longest time a row waits before it is written",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
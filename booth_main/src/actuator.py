@@ -0,0 +1,187 @@
+import heapq
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+from gi.repository import GLib
+
+from devices.relay import Relay
+
+PRIORITY_FEEDBACK = 0
+PRIORITY_DISPENSE = 10
+PRIORITY_ALARM = 20
+
+
+# Alternating on and off durations in milliseconds, starting with on
+@dataclass(frozen=True)
+class Pattern:
+    steps: Tuple[int, ...]
+    priority: int = PRIORITY_FEEDBACK
+    # Repeating patterns play until cancelled, pausing for one-shot patterns
+    repeat: bool = False
+
+    @classmethod
+    def pulse(cls, duration_ms: int, priority: int = PRIORITY_FEEDBACK) -> "Pattern":
+        return cls((duration_ms,), priority)
+
+
+BEEP_STARTED = Pattern.pulse(50)
+BEEP_SCANNED = Pattern.pulse(500)
+BEEP_REJECTED = Pattern((200, 200, 200))
+BEEP_FAILED = Pattern.pulse(5000, PRIORITY_ALARM)
+BEEP_DISPLAY_FAILED = Pattern.pulse(7000, PRIORITY_ALARM)
+ALARM_ABNORMAL_TEMPERATURE = Pattern((1000, 1000), PRIORITY_ALARM, repeat=True)
+
+
+class _Playback:
+    def __init__(self, pattern: Pattern, started_at: float):
+        self.pattern = pattern
+        self.step = 0
+        self.deadline = started_at + pattern.steps[0] / 1000
+
+
+# Plays patterns on relays from a single GLib timer source. Deadlines are absolute, so a
+# late wake-up shortens the next step instead of delaying the rest. One-shot patterns
+# replace each other by priority, while repeating ones pause for any one-shot pattern
+# and then resume
+class ActuatorScheduler:
+    _source_id: Optional[int] = None
+    _source_deadline: Optional[float] = None
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._playbacks: Dict[Relay, _Playback] = {}
+        # Repeating patterns paused by a one-shot pattern, resumed once it finishes
+        self._suspended: Dict[Relay, Pattern] = {}
+        # Entries of (deadline, sequence, relay, playback); the sequence breaks ties
+        self._deadlines: List[Tuple[float, int, Relay, _Playback]] = []
+        self._sequence = 0
+
+    def play(self, relay: Relay, pattern: Pattern) -> bool:
+        # Returns whether the pattern started or, if repeating, will once the one-shot
+        # pattern playing finishes
+        current = self._playbacks.get(relay)
+
+        if current is not None and not current.pattern.repeat:
+            if pattern.repeat:
+                self._suspended[relay] = pattern
+                return True
+
+            if current.pattern.priority > pattern.priority:
+                return False
+        elif current is not None and not pattern.repeat:
+            self._suspended[relay] = current.pattern
+        else:
+            self._suspended.pop(relay, None)
+
+        self._start(relay, pattern)
+        self._reschedule()
+        return True
+
+    def cancel(self, relay: Relay, pattern: Optional[Pattern] = None) -> None:
+        # Stops what is playing on `relay`, or only `pattern` if given
+        if pattern is None:
+            self._suspended.pop(relay, None)
+        elif self._suspended.get(relay) == pattern:
+            # The one-shot pattern it was paused for keeps playing
+            del self._suspended[relay]
+            return
+
+        current = self._playbacks.get(relay)
+
+        if current is None or (pattern is not None and current.pattern != pattern):
+            return
+
+        self._finish(relay)
+        self._reschedule()
+
+    def stop(self) -> None:
+        for relay in self._playbacks:
+            relay.turn_off()
+
+        self._playbacks.clear()
+        self._suspended.clear()
+        self._deadlines.clear()
+        self._reschedule()
+
+    def tick(self) -> None:
+        # Advances every pattern that is due
+        now = self._clock()
+
+        while len(self._deadlines) > 0 and self._deadlines[0][0] <= now:
+            _, _, relay, playback = heapq.heappop(self._deadlines)
+
+            if self._playbacks.get(relay) is playback:
+                self._advance(relay, playback)
+
+    def _advance(self, relay: Relay, playback: _Playback) -> None:
+        steps = playback.pattern.steps
+        playback.step += 1
+
+        if playback.step == len(steps):
+            if not playback.pattern.repeat:
+                self._finish(relay)
+                return
+
+            playback.step = 0
+
+        if playback.step % 2 == 0:
+            relay.turn_on()
+        else:
+            relay.turn_off()
+
+        playback.deadline += steps[playback.step] / 1000
+        self._push(relay, playback)
+
+    def _start(self, relay: Relay, pattern: Pattern) -> None:
+        playback = _Playback(pattern, self._clock())
+        self._playbacks[relay] = playback
+        relay.turn_on()
+        self._push(relay, playback)
+
+    def _finish(self, relay: Relay) -> None:
+        del self._playbacks[relay]
+        relay.turn_off()
+        suspended = self._suspended.pop(relay, None)
+
+        if suspended is not None:
+            self._start(relay, suspended)
+
+    def _push(self, relay: Relay, playback: _Playback) -> None:
+        self._sequence += 1
+        heapq.heappush(
+            self._deadlines,
+            (playback.deadline, self._sequence, relay, playback),
+        )
+
+    def _reschedule(self) -> None:
+        # Cancelled and preempted entries are only dropped once they reach the top
+        while len(self._deadlines) > 0:
+            _, _, relay, playback = self._deadlines[0]
+
+            if self._playbacks.get(relay) is playback:
+                break
+
+            heapq.heappop(self._deadlines)
+
+        deadline = self._deadlines[0][0] if len(self._deadlines) > 0 else None
+
+        if deadline == self._source_deadline:
+            return
+
+        if self._source_id is not None:
+            GLib.source_remove(self._source_id)
+            self._source_id = None
+
+        self._source_deadline = deadline
+
+        if deadline is not None:
+            delay_ms = max(0, round((deadline - self._clock()) * 1000))
+            self._source_id = GLib.timeout_add(delay_ms, self._on_timeout)
+
+    def _on_timeout(self) -> bool:
+        self._source_id = None
+        self._source_deadline = None
+        self.tick()
+        self._reschedule()
+        return False
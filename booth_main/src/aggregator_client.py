@@ -0,0 +1,83 @@
+import json
+import socket
+from typing import List, Optional
+
+from person import Person
+from utils import log_info
+
+DEFAULT_TIMEOUT_SECS = 60.0
+
+
+class AggregatorError(Exception):
+    def __init__(self, message: str):
+        self._message = message
+
+    def __str__(self):
+        return f"Aggregator rejected batch: {self._message}"
+
+
+# Drop-in for Spreadsheet in SpreadsheetUploader that pushes batches over one persistent
+# connection; append_persons returns once the aggregator has written the batch
+class AggregatorClient:
+    _socket: Optional[socket.socket] = None
+
+    def __init__(
+        self, address: str, booth_id: str, timeout_secs: float = DEFAULT_TIMEOUT_SECS
+    ):
+        host, _, port = address.rpartition(":")
+        self._booth_id = booth_id
+        self._batch_id = 0
+        self._socket = socket.create_connection((host, int(port)), timeout_secs)
+        self._file = self._socket.makefile("rwb")
+        log_info(f"Connected to aggregator at {address}")
+
+    def __del__(self):
+        self.close()
+
+    def close(self) -> None:
+        # Also called from __del__ when connecting failed
+        if self._socket is None:
+            return
+
+        self._file.close()
+        self._socket.close()
+        self._socket = None
+
+    def append_person(self, person: Person) -> None:
+        self.append_persons([person])
+
+    def append_persons(self, persons: List[Person]) -> None:
+        self._batch_id += 1
+        message = {
+            "booth_id": self._booth_id,
+            "batch_id": self._batch_id,
+            # Formatted the same way Spreadsheet writes its rows
+            "persons": [
+                {
+                    "name": str(person.name),
+                    "address": str(person.address),
+                    "contact_number": str(person.contact_number),
+                    "room_id": str(person.room_id),
+                    "temperature": str(person.temperature),
+                    "time_detected": str(person.time_detected),
+                }
+                for person in persons
+            ],
+        }
+        self._file.write(json.dumps(message).encode() + b"\n")
+        self._file.flush()
+
+        line = self._file.readline()
+
+        if line == b"":
+            raise ConnectionError("Aggregator closed the connection")
+
+        reply = json.loads(line)
+
+        if reply.get("batch_id") != self._batch_id:
+            raise AggregatorError(f"acknowledged batch {reply.get('batch_id')}")
+
+        if "error" in reply:
+            raise AggregatorError(reply["error"])
+
+        log_info(f"Pushed {len(persons)} Person(s) to aggregator")
@@ -1,23 +1,38 @@
-from threading import Thread
+import sqlite3
+import time
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Union
-
-from gi.repository import GLib
-
-from camera import Camera
-from person import Person, PersonParseError
-from spreadsheet import Spreadsheet
-from utils import log_error, log_info
+from typing import Iterator, List, Optional, Tuple
+
+from gi.repository import GLib, Gst
+
+import actuator
+from actuator import ActuatorScheduler, Pattern
+from camera import Camera, Symbol
+from visit import Visit, VisitState
+from config import CheckInConfig, Config, RosterConfig
+from dedup import DedupCache
+from journal import Journal
+import metrics
+from metrics import MetricsServer
+from payload import is_id_payload
+from person import ANONYMOUS, Person, PersonParseError
+from roster import Roster
+from uploader import SpreadsheetUploader
+from utils import log_error, log_info, log_warn
 from devices.proximity import ProximitySensor
 from devices.temperature import TemperatureSensor
 from devices.display import Display
 from devices.relay import Relay
 
-DEFAULT_CODE_DETECTED_TIMEOUT = 5  # seconds
 DEFAULT_TEMPERATURE = -1
-DEFAULT_SPREADSHEET_ID = "1IA6YhAdkvdNkkPPyhCj5JQrB8dcaKZNWzk-4gI0Ea4Y"
 
 PUMP_DISPENSE_DURATION_MS = 1000
+# How often the sensor is checked for the measured hand to be taken away
+HAND_CLEAR_POLL_MS = 50
+PUMP_DISPENSE_PATTERN = Pattern.pulse(
+    PUMP_DISPENSE_DURATION_MS, actuator.PRIORITY_DISPENSE
+)
 
 # GPIO ports
 PROXIMITY_SENSOR_IO = 4
@@ -26,180 +41,491 @@ BUZZER_IO = 9
 
 
 class Application:
-    _last_code: Union[str, None] = None
-    _abnormal_temperature_handler = None
-
+    _loop: Optional[GLib.MainLoop] = None
+    _last_dispensed_at = 0.0
+    _hold_off_id: Optional[int] = None
+
+    # A new hand is only measured once the last measured one was taken away, so a
+    # hand that stays under the sensor is not measured again for the next visitor
+    _is_hand_cleared = True
+    _hand_clear_id: Optional[int] = None
+    _n_measuring = 0
+
+    # The visitor whose code was scanned and who has yet to put their hand under
+    # the sensor; visitors past this state finish on their own
+    _waiting_visit: Optional[Visit] = None
+
+    _actuators: ActuatorScheduler
+    _dedup_cache: DedupCache
     _camera: Camera
-    _display: Display
+    _display: Optional[Display] = None
     _pump: Relay
     _buzzer: Relay
     _proximity_sensor: ProximitySensor
     _temperature_sensor: TemperatureSensor
+    _journal: Journal
+    _uploader: SpreadsheetUploader
+    _metrics_server: Optional[MetricsServer] = None
+    _roster: Optional[Roster] = None
 
-    def __init__(self):
+    def __init__(self, config: Config):
         init_successful = True
+        started_at = time.monotonic()
+        self._startup_timings: List[Tuple[str, float]] = []
+
+        self._check_in_config: CheckInConfig = config.check_in
+        self._roster_config: RosterConfig = config.roster
+
+        # The display and buzzer come first so there is feedback while the rest loads
+        with self._startup_stage("display"):
+            self._actuators = ActuatorScheduler()
+            self._buzzer = Relay(BUZZER_IO)
+
+            try:
+                self._display = Display([" Place QR Code  ", " ^ ^ Above ^ ^  "])
+                self._display.write(["  Starting up   ", "  please wait   "])
+                self._display.flush()
+            except OSError as error:
+                # The booth still checks visitors in, with the buzzer as feedback
+                self._display = None
+                init_successful = False
+                log_error(f"Failed to initialize display: {error}")
+                self._beep(actuator.BEEP_DISPLAY_FAILED)
+
+        # Opening the camera is the slowest part, so it pre-rolls while the rest loads
+        with self._startup_stage("gstreamer"):
+            Gst.init(None)
+
+            self._camera = Camera(config.camera)
+            self._camera.connect("error", lambda _: self._beep(actuator.BEEP_FAILED))
+            self._camera.connect("codes-detected", self._on_codes_detected)
+
+            # Failing here is left to `start`, which reports it and keeps retrying
+            try:
+                self._camera.preroll()
+            except Exception as error:
+                log_warn(f"Failed to pre-roll camera: {error}")
+
+        with self._startup_stage("sensors"):
+            self._proximity_sensor = ProximitySensor(
+                PROXIMITY_SENSOR_IO,
+                config.proximity.edge_detect,
+                config.proximity.debounce_ms,
+                config.proximity.poll_interval_ms,
+            )
+            self._proximity_sensor.connect(
+                "detected", self._on_proximity_sensor_detected
+            )
 
-        self._proximity_sensor = ProximitySensor(PROXIMITY_SENSOR_IO)
-        self._detected_handler_id = self._proximity_sensor.connect(
-            "detected", self._on_proximity_sensor_detected
-        )
+            self._temperature_sensor = TemperatureSensor(
+                config.temperature.sample_rate_hz,
+                config.temperature.window_ms,
+                config.temperature.trim_ratio,
+                config.temperature.ambient_reference,
+                config.temperature.ambient_coefficient,
+                config.temperature.offset,
+            )
 
-        self._temperature_sensor = TemperatureSensor()
+            self._pump = Relay(PUMP_IO, True)
 
-        self._buzzer = Relay(BUZZER_IO)
+        with self._startup_stage("storage"):
+            self._journal = Journal(config.storage.journal_path)
 
-        self._pump = Relay(PUMP_IO, True)
+            # Connects to the spreadsheet or aggregator on its own thread
+            self._uploader = SpreadsheetUploader(
+                config.storage.spreadsheet_id,
+                self._journal,
+                config.storage.upload_batch_size,
+                config.storage.upload_batch_age_secs,
+                config.storage.aggregator_address,
+                config.storage.booth_id,
+            )
+            self._uploader.connect("error", self._on_uploader_error)
+            self._uploader.start()
 
-        try:
-            self._display = Display([" Place QR Code  ", " ^ ^ Above ^ ^  "])
-        except OSError as error:
-            init_successful = False
-            log_error(f"Failed to initialize display: {error}")
-            self._buzzer.ephemeral_on(7000)
-
-        self._camera = Camera()
-        self._camera.connect("error", lambda _: self._buzzer.ephemeral_on(5000))
-        self._code_detected_handler_id = self._camera.connect(
-            "code-detected", self._on_code_detected
-        )
+            self._dedup_cache = DedupCache(
+                config.dedup.window_secs, config.dedup.max_size
+            )
 
-        try:
+            if config.roster.path != "":
+                # Loads on its own thread
+                self._roster = Roster(config.roster.path)
+                self._roster.reload_if_changed()
+                GLib.timeout_add_seconds(
+                    config.roster.reload_interval_secs, self._reload_roster
+                )
+
+        with self._startup_stage("metrics"):
+            if config.metrics.http_port > 0:
+                try:
+                    self._metrics_server = MetricsServer(
+                        metrics.registry,
+                        config.metrics.http_host,
+                        config.metrics.http_port,
+                    )
+                    self._metrics_server.start()
+                except OSError as error:
+                    log_error(f"Failed to start metrics server: {error}")
+
+            if config.metrics.dump_path != "":
+                GLib.timeout_add_seconds(
+                    config.metrics.dump_interval_secs,
+                    self._dump_metrics,
+                    config.metrics.dump_path,
+                )
+
+        with self._startup_stage("camera"):
+            # Failures are retried by the camera and reported through `error`
             self._camera.start()
-        except Exception as error:
-            init_successful = False
-            log_error(f"Failed to start camera: {error}")
-            self._buzzer.ephemeral_on(5000)
+            init_successful = init_successful and not self._camera.is_down
 
-        GLib.timeout_add_seconds(5, self._reset_last_code)
+        if self._display is not None:
+            self._display.reset()
+
+        startup_secs = time.monotonic() - started_at
+        metrics.set_gauge("startup_seconds", startup_secs)
+        log_info(
+            f"Ready to scan after {startup_secs:.3f} seconds",
+            stage="startup",
+            **{name: f"{secs:.3f}" for name, secs in self._startup_timings},
+        )
 
         if init_successful:
-            self._buzzer.ephemeral_on(50)
+            self._beep(actuator.BEEP_STARTED)
 
     def run(self):
-        loop = GLib.MainLoop()
+        self._loop = GLib.MainLoop()
 
         try:
-            loop.run()
+            self._loop.run()
         except KeyboardInterrupt:
-            loop.quit()
+            self._loop.quit()
         finally:
-            self._display.clear()
+            self._loop = None
+            self._actuators.stop()
+            self._camera.stop()
 
-    def _on_proximity_sensor_detected(self, proximity_sensor: ProximitySensor) -> None:
-        log_info("Proximity sensor detected something")
+            # A sync still running past the timeout would use a closed connection
+            if self._uploader.stop():
+                self._journal.close()
+            else:
+                log_warn("Uploader is still syncing; leaving the journal open")
 
-        self._proximity_sensor.handler_block(self._detected_handler_id)
+            if self._metrics_server is not None:
+                self._metrics_server.stop()
 
-        self._pump.ephemeral_on(PUMP_DISPENSE_DURATION_MS)
-        temperature = self._temperature_sensor.get_object_temperature()
-        self._check_abnormal_temperature(temperature)
-        self._display.ephemeral_write(
-            ["  Temperature:  ", f"     {temperature:.1f} C     "], 3
-        )
+            if self._display is not None:
+                self._display.clear()
+
+    def quit(self) -> None:
+        if self._loop is not None:
+            self._loop.quit()
+
+    @contextmanager
+    def _startup_stage(self, name: str) -> Iterator[None]:
+        started_at = time.monotonic()
 
         try:
-            person = Person.from_str(
-                f"""
-name: Unknown
-address: Unknown
-contact_number: Unknown
-room_id: Unknown
-time_detected: {datetime.now().isoformat()}
-temperature: {temperature}
-"""
+            yield
+        finally:
+            secs = time.monotonic() - started_at
+            self._startup_timings.append((name, secs))
+            metrics.set_gauge(f"startup_{name}_seconds", secs)
+
+    def _on_proximity_sensor_detected(self, proximity_sensor: ProximitySensor) -> None:
+        self._camera.wake("proximity")
+
+        if not self._is_hand_cleared:
+            # The same hand that is still being served
+            return
+
+        visit = self._waiting_visit
+        secs_since_dispensed = time.monotonic() - self._last_dispensed_at
+        hold_off_secs = PUMP_DISPENSE_DURATION_MS / 1000 - secs_since_dispensed
+
+        if hold_off_secs > 0:
+            # Checked again once the pump is done, as the hand may stay
+            if visit is not None and self._hold_off_id is None:
+                self._hold_off_id = GLib.timeout_add(
+                    int(hold_off_secs * 1000) + 1, self._on_hold_off_done
+                )
+            return
+
+        if visit is None:
+            log_info("Proximity sensor detected something")
+            self._start_measuring(Visit(None, time.monotonic()))
+            return
+
+        self._waiting_visit = None
+        metrics.observe("proximity_wait", time.monotonic() - visit.detected_at)
+        log_info(
+            "Proximity sensor detected something. Dispensing alcohol and getting temp"
+        )
+        self._start_measuring(visit)
+
+    def _on_codes_detected(self, camera: Camera, symbols: List[Symbol]) -> None:
+        if len(symbols) > 1:
+            log_info(f"Detected {len(symbols)} codes in one frame", stage="scan")
+
+        # Only the first new code can wait for a hand; the rest are ignored without
+        # being remembered, so they are taken from a later frame once it is their turn
+        for symbol in symbols:
+            self._on_code_detected(symbol.data)
+
+    def _on_code_detected(self, code: str) -> None:
+        if self._waiting_visit is not None:
+            # Checked before dedup so the code is not remembered and can be
+            # scanned again once the previous visitor moves on
+            return
+
+        detected_at = time.monotonic()
+        metrics.increment("codes_detected")
+
+        if not self._can_look_up(code):
+            # Also before dedup, so the code is accepted once the roster is loaded
+            metrics.increment("codes_before_roster")
+            self._show_message([" Roster loading ", "Please try again"])
+            log_info("Roster is not loaded yet; ignoring code", stage="roster")
+            return
+
+        with metrics.time_stage("dedup"):
+            is_duplicate = self._dedup_cache.check(code)
+
+        if is_duplicate:
+            metrics.increment("duplicate_codes")
+            log_info(
+                "Code was already scanned recently; ignoring",
+                stage="dedup",
+                hits=self._dedup_cache.n_hits,
+                misses=self._dedup_cache.n_misses,
             )
-            self._try_store_person_to_spreadsheet(person)
-        except PersonParseError as error:
-            self._handle_person_parse_error(error)
+            return
 
-        self._proximity_sensor.handler_unblock(self._detected_handler_id)
+        visit = Visit(code, detected_at)
 
-    def _on_code_detected(self, camera: Camera, code: str) -> None:
-        self._camera.handler_block(self._code_detected_handler_id)
-        self._proximity_sensor.handler_block(self._detected_handler_id)
+        if self._roster is not None:
+            with metrics.time_stage("roster_lookup"):
+                visit.roster_entry = self._roster.lookup(code)
 
-        if self._last_code == code:
-            log_info("Same code as last; returning...")
-        else:
-            self._buzzer.ephemeral_on(500)
-            self._handle_new_code_detected(code)
+            if visit.roster_entry is None and (
+                is_id_payload(code) or self._roster_config.reject_unknown
+            ):
+                self._reject_unknown_code(code)
+                return
 
-    def _store_person_to_spreadsheet_thread(self, person: Person) -> None:
-        Spreadsheet(DEFAULT_SPREADSHEET_ID).append_person(person)
+        self._beep(actuator.BEEP_SCANNED)
+        log_info("New detected code", stage="scan", code=code)
+        self._wait_for_hand(visit)
 
-    def _try_store_person_to_spreadsheet(self, person: Person) -> None:
-        try:
-            thread = Thread(
-                target=self._store_person_to_spreadsheet_thread, args=[person]
-            )
-            thread.run()
-        except Exception as error:
-            log_error(f"Failed to store person to spreadsheet: {error}")
+    def _can_look_up(self, code: str) -> bool:
+        if self._roster is None or self._roster.is_loaded:
+            return True
 
-    def _handle_proximity_sensor_wait_for_input(
-        self, is_timeout_reached: bool, code: str
-    ) -> None:
-        temperature = DEFAULT_TEMPERATURE
+        # Only codes that would be rejected when missing need to wait
+        return not is_id_payload(code) and not self._roster_config.reject_unknown
 
-        if is_timeout_reached:
-            self._display.ephemeral_write(["   Received no  ", "  Temperature   "], 3)
-            log_info(
-                "Skipped dispensing alcohol and getting temperature: Timeout reached"
-            )
-        else:
-            log_info(
-                "Proximity sensor detected something. Dispensing alcohol and getting temp"
-            )
+    def _reject_unknown_code(self, code: str) -> None:
+        metrics.increment("unknown_codes")
+        self._beep(actuator.BEEP_REJECTED)
+        self._show_message([" Unknown QR Code", "Please see staff"])
+        log_error("Code is not on the roster", stage="roster", code=code)
 
-            self._pump.ephemeral_on(PUMP_DISPENSE_DURATION_MS)
-            temperature = self._temperature_sensor.get_object_temperature()
-            self._check_abnormal_temperature(temperature)
-            self._display.ephemeral_write(
-                ["  Temperature:  ", f"     {temperature:.1f} C     "], 3
-            )
+    def _reload_roster(self) -> bool:
+        if self._roster is not None:
+            self._roster.reload_if_changed()
+
+        return True
 
+    def _on_uploader_error(self, uploader: SpreadsheetUploader, message: str) -> None:
+        metrics.increment("upload_errors")
+        log_error(f"Failed to sync journal to spreadsheet: {message}", stage="upload")
+
+    def _store_person(self, person: Person) -> None:
         try:
-            person = Person.from_str(
-                f"{code}\ntime_detected: {datetime.now().isoformat()}\ntemperature: {temperature}"
-            )
-            self._try_store_person_to_spreadsheet(person)
-            self._display.ephemeral_write([person.name, "Hi, info logged "], 3)
-        except PersonParseError as error:
-            self._handle_person_parse_error(error)
+            with metrics.time_stage("journal_write"):
+                self._journal.append(person)
+        except sqlite3.Error as error:
+            log_error(f"Failed to store person to journal: {error}", stage="journal")
+            return
 
-        self._camera.handler_unblock(self._code_detected_handler_id)
-        self._proximity_sensor.handler_unblock(self._detected_handler_id)
+        self._uploader.notify()
 
-    def _handle_new_code_detected(self, code: str) -> None:
-        log_info(f"New detected code `{code}`")
+    def _wait_for_hand(self, visit: Visit) -> None:
+        timeout_secs = self._check_in_config.hand_timeout_secs
 
-        self._last_code = code
+        log_info(f"Waiting {timeout_secs} seconds for hand")
+        self._show([" Put hand below ", " alcohol & temp "])
 
-        log_info(f"Waiting {DEFAULT_CODE_DETECTED_TIMEOUT} seconds for hand")
-        self._display.write([" Put hand below ", " alcohol & temp "])
-        self._proximity_sensor.wait_for_input(
-            DEFAULT_CODE_DETECTED_TIMEOUT,
-            self._handle_proximity_sensor_wait_for_input,
-            code,
+        self._waiting_visit = visit
+        visit.timeout_id = GLib.timeout_add(
+            int(timeout_secs * 1000), self._on_hand_timeout, visit
         )
+        self._check_waiting_hand()
 
-    def _handle_person_parse_error(self, error: PersonParseError) -> None:
-        self._buzzer.ephemeral_on(200)
-        GLib.timeout_add(400, self._buzzer.ephemeral_on, 200)
-        log_error(f"Failed parsing Person from string: {error}")
+    def _check_waiting_hand(self) -> None:
+        # For a hand already under the sensor, which makes no new edge. While another
+        # visitor is measured, their hand would be taken for this one's
+        if self._waiting_visit is None or not self._is_hand_cleared:
+            return
 
-    def _check_abnormal_temperature(self, temp: float) -> None:
-        if self._abnormal_temperature_handler is not None:
-            GLib.source_remove(self._abnormal_temperature_handler)
-            self._abnormal_temperature_handler = None
+        if self._n_measuring == 0:
+            self._proximity_sensor.check_level()
+
+    def _on_hold_off_done(self) -> bool:
+        self._hold_off_id = None
+        self._check_waiting_hand()
+        return False
 
-        def __inner():
-            self._buzzer.ephemeral_on(1000)
+    def _on_hand_clear_poll(self) -> bool:
+        if self._proximity_sensor.is_active:
             return True
 
-        if temp > 38.0:
-            self._abnormal_temperature_handler = GLib.timeout_add_seconds(2, __inner)
+        self._hand_clear_id = None
+        self._is_hand_cleared = True
+        self._check_waiting_hand()
+        return False
+
+    def _on_hand_timeout(self, visit: Visit) -> bool:
+        visit.timeout_id = None
+
+        if self._waiting_visit is visit:
+            self._waiting_visit = None
+
+        metrics.observe("proximity_wait", time.monotonic() - visit.detected_at)
+        self._show_message(["   Received no  ", "  Temperature   "])
+        log_info("Skipped dispensing alcohol and getting temperature: Timeout reached")
+        self._finish_visit(visit, DEFAULT_TEMPERATURE)
+        return False
+
+    def _start_measuring(self, visit: Visit) -> None:
+        if not visit.transition(VisitState.MEASURING):
+            return
+
+        self._n_measuring += 1
+        self._is_hand_cleared = False
+
+        if self._hand_clear_id is None:
+            self._hand_clear_id = GLib.timeout_add(
+                HAND_CLEAR_POLL_MS, self._on_hand_clear_poll
+            )
+
+        if visit.timeout_id is not None:
+            GLib.source_remove(visit.timeout_id)
+
+        visit.timeout_id = GLib.timeout_add(
+            int(self._check_in_config.measure_timeout_secs * 1000),
+            self._on_measure_timeout,
+            visit,
+        )
+
+        self._dispense()
+        read_started_at = time.monotonic()
+
+        def on_temperature_read(temperature: Optional[float]) -> None:
+            if visit.state != VisitState.MEASURING:
+                return
+
+            if visit.timeout_id is not None:
+                GLib.source_remove(visit.timeout_id)
+                visit.timeout_id = None
+
+            metrics.observe("temperature_read", time.monotonic() - read_started_at)
+            self._finish_visit(visit, self._handle_temperature_read(temperature))
+
+        self._temperature_sensor.read_object_temperature_async(on_temperature_read)
+
+    def _on_measure_timeout(self, visit: Visit) -> bool:
+        visit.timeout_id = None
+        metrics.increment("temperature_timeouts")
+        log_error("Timed out waiting for temperature reading", stage="temperature")
+        self._finish_visit(visit, self._handle_temperature_read(None))
+        return False
+
+    def _dispense(self) -> None:
+        self._last_dispensed_at = time.monotonic()
+
+        self._actuators.play(self._pump, PUMP_DISPENSE_PATTERN)
+
+    def _handle_temperature_read(self, temperature: Optional[float]) -> float:
+        if temperature is None:
+            self._show_message(["   Received no  ", "  Temperature   "])
+            return DEFAULT_TEMPERATURE
+
+        self._check_abnormal_temperature(temperature)
+        self._show_message(["  Temperature:  ", f"     {temperature:.1f} C     "])
+        return temperature
+
+    def _finish_visit(self, visit: Visit, temperature: float) -> None:
+        was_measuring = visit.state == VisitState.MEASURING
+
+        if not visit.transition(VisitState.DONE):
+            return
+
+        if was_measuring:
+            self._n_measuring -= 1
+            self._check_waiting_hand()
+
+        if visit.code is None:
+            person = Person(
+                ANONYMOUS, ANONYMOUS, ANONYMOUS, ANONYMOUS, temperature, datetime.now()
+            )
+            self._store_person(person)
+            return
+
+        entry = visit.roster_entry
+
+        if entry is not None:
+            person = Person(
+                entry.name,
+                entry.address,
+                entry.contact_number,
+                entry.room_id,
+                temperature,
+                datetime.now(),
+            )
+        else:
+            try:
+                with metrics.time_stage("parse"):
+                    person = Person.from_code(visit.code, datetime.now(), temperature)
+            except PersonParseError as error:
+                self._handle_person_parse_error(error)
+                return
+
+        self._store_person(person)
+        metrics.observe("scan_to_log", time.monotonic() - visit.detected_at)
+
+        if self._waiting_visit is not None:
+            # Keep prompting the next visitor instead of resetting to the default text
+            self._show([person.name, " Put hand below "])
+        else:
+            self._show_message([person.name, "Hi, info logged "])
+
+    def _show(self, lines: List[str]) -> None:
+        if self._display is not None:
+            self._display.write(lines)
+
+    def _show_message(self, lines: List[str]) -> None:
+        if self._display is not None:
+            self._display.ephemeral_write(lines, self._check_in_config.message_secs)
+
+    def _dump_metrics(self, path: str) -> bool:
+        try:
+            metrics.registry.dump(path)
+        except OSError as error:
+            log_error(f"Failed to dump metrics to `{path}`: {error}")
 
-    def _reset_last_code(self):
-        self._last_code = None
         return True
+
+    def _handle_person_parse_error(self, error: PersonParseError) -> None:
+        metrics.increment("parse_errors")
+        self._beep(actuator.BEEP_REJECTED)
+        log_error(f"Failed parsing Person from string: {error}", stage="parse")
+
+    def _check_abnormal_temperature(self, temp: float) -> None:
+        if temp > 38.0:
+            self._beep(actuator.ALARM_ABNORMAL_TEMPERATURE)
+        else:
+            self._actuators.cancel(self._buzzer, actuator.ALARM_ABNORMAL_TEMPERATURE)
+
+    def _beep(self, pattern: Pattern) -> None:
+        self._actuators.play(self._buzzer, pattern)
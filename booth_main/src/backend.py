@@ -0,0 +1,113 @@
+import os
+from typing import Any
+
+from gi.repository import Gst
+
+BACKEND_ENV_VAR = "BOOTH_BACKEND"
+HARDWARE_BACKEND = "hardware"
+FAKE_BACKEND = "fake"
+
+I2C_BUS_NUMBER = 1
+
+_backend = os.environ.get(BACKEND_ENV_VAR, HARDWARE_BACKEND)
+
+
+class UnknownBackendError(Exception):
+    def __init__(self, name: str):
+        self._name = name
+
+    def __str__(self):
+        return (
+            f"Unknown backend `{self._name}`; "
+            f"expected `{HARDWARE_BACKEND}` or `{FAKE_BACKEND}`"
+        )
+
+
+def use_backend(name: str) -> None:
+    global _backend
+
+    if name not in (HARDWARE_BACKEND, FAKE_BACKEND):
+        raise UnknownBackendError(name)
+
+    _backend = name
+
+
+def is_fake() -> bool:
+    if _backend not in (HARDWARE_BACKEND, FAKE_BACKEND):
+        raise UnknownBackendError(_backend)
+
+    return _backend == FAKE_BACKEND
+
+
+def get_gpio() -> Any:
+    if is_fake():
+        import fakes
+
+        return fakes.gpio
+
+    import RPi.GPIO as GPIO
+
+    return GPIO
+
+
+def create_lcd(width: int, rows: int) -> Any:
+    if is_fake():
+        import fakes
+
+        return fakes.FakeLCD(width, rows)
+
+    from rpi_lcd import LCD
+
+    return LCD(width=width, rows=rows)
+
+
+def create_i2c_bus() -> Any:
+    if is_fake():
+        import fakes
+
+        return fakes.FakeSMBus(I2C_BUS_NUMBER)
+
+    from smbus2.smbus2 import SMBus
+
+    return SMBus(I2C_BUS_NUMBER)
+
+
+def create_thermometer(bus: Any) -> Any:
+    if is_fake():
+        import fakes
+
+        return fakes.thermometer
+
+    from mlx90614 import MLX90614
+
+    return MLX90614(bus)
+
+
+def create_spreadsheet(id: str) -> Any:
+    if is_fake():
+        import fakes
+
+        return fakes.FakeSpreadsheet(id)
+
+    from spreadsheet import Spreadsheet
+
+    return Spreadsheet(id)
+
+
+def get_camera_source(device: str) -> str:
+    if is_fake():
+        import fakes
+
+        return fakes.camera_feed.source_description()
+
+    if device == "":
+        return "v4l2src"
+
+    return f"v4l2src device={device}"
+
+
+def on_pipeline_created(pipeline: Gst.Pipeline) -> None:
+    if is_fake():
+        import fakes
+
+        fakes.camera_feed.attach(pipeline)
@@ -0,0 +1,209 @@
+import os
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser, Namespace
+from datetime import datetime, timedelta
+from threading import Thread
+from typing import Dict, List, Optional
+
+import gi
+
+gi.require_version("Gst", "1.0")
+from gi.repository import GLib, Gst
+
+import backend
+
+backend.use_backend(backend.FAKE_BACKEND)
+
+import fakes
+from application import Application, PROXIMITY_SENSOR_IO
+from config import Config
+from journal import Journal
+from payload import encode_payload
+from person import Person
+from utils import log_error, log_info
+
+PIPELINE_WARMUP_SECS = 2.0
+JOURNAL_POLL_INTERVAL_SECS = 0.005
+HAND_HOLD_SECS = 0.1
+
+
+class BenchmarkResult:
+    def __init__(self):
+        self.scanned_at: Dict[str, datetime] = {}
+        self.scan_to_journal_secs: List[float] = []
+        self.scan_to_sheet_secs: List[float] = []
+        self.n_timeouts = 0
+        self.elapsed_secs = 0.0
+
+
+def render_frame(payload: str, width: int, height: int) -> bytes:
+    # Only needed to benchmark, so it is not a booth dependency
+    import qrcode
+    from PIL import Image
+
+    qr = qrcode.QRCode(border=4)
+    qr.add_data(payload)
+    qr.make(fit=True)
+    # Largest whole-pixel modules that fit the frame
+    qr.box_size = max(1, min(width, height) // (qr.modules_count + 2 * qr.border))
+
+    code = qr.make_image(fill_color="black", back_color="white").get_image()
+    code = code.convert("L")
+
+    frame = Image.new("L", (width, height), 255)
+    frame.paste(code, ((width - code.width) // 2, (height - code.height) // 2))
+    return frame.tobytes()
+
+
+def wait_for_journal_entry(
+    journal: Journal, name: str, since: datetime, timeout_secs: float
+) -> Optional[Person]:
+    deadline = time.monotonic() + timeout_secs
+
+    while time.monotonic() < deadline:
+        for person in journal.get_persons_between(since, datetime.max):
+            if person.name == name:
+                return person
+
+        time.sleep(JOURNAL_POLL_INTERVAL_SECS)
+
+    return None
+
+
+def drive_visitors(
+    app: Application, journal_path: str, args: Namespace, result: BenchmarkResult
+) -> None:
+    feed = fakes.camera_feed
+    frames = [
+        render_frame(
+            encode_payload(f"Visitor {index:05d}", "Benchmark", "0", "R1"),
+            feed.width,
+            feed.height,
+        )
+        for index in range(args.visitors)
+    ]
+    journal = Journal(journal_path)
+
+    time.sleep(PIPELINE_WARMUP_SECS)
+    start = time.monotonic()
+
+    for index, frame in enumerate(frames):
+        name = f"Visitor {index:05d}"
+        # time_detected is wall-clock, so the scan time has to be too
+        scanned_at = datetime.now()
+        result.scanned_at[name] = scanned_at
+
+        feed.show(frame)
+        time.sleep(args.hand_delay_ms / 1000)
+        fakes.gpio.set_input(PROXIMITY_SENSOR_IO, fakes.gpio.LOW)
+        time.sleep(HAND_HOLD_SECS)
+        fakes.gpio.set_input(PROXIMITY_SENSOR_IO, fakes.gpio.HIGH)
+        feed.clear()
+
+        person = wait_for_journal_entry(
+            journal, name, scanned_at - timedelta(seconds=1), args.timeout_secs
+        )
+
+        if person is None:
+            log_error(f"{name} was not logged within {args.timeout_secs} seconds")
+            result.n_timeouts += 1
+            continue
+
+        result.scan_to_journal_secs.append(
+            (person.time_detected - scanned_at).total_seconds()
+        )
+
+    result.elapsed_secs = time.monotonic() - start
+    journal.close()
+    GLib.idle_add(app.quit)
+
+
+def percentile(values: List[float], ratio: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(ratio * len(ordered)))]
+
+
+def format_latencies(values: List[float]) -> str:
+    if len(values) == 0:
+        return "no samples"
+
+    return ", ".join(
+        f"p{int(ratio * 100)} {percentile(values, ratio) * 1000:.0f} ms"
+        for ratio in (0.5, 0.9, 0.99, 1.0)
+    )
+
+
+def main(args: Namespace) -> int:
+    Gst.init(None)
+    fakes.gpio.setmode(fakes.gpio.BCM)
+    fakes.spreadsheet_latency_secs = args.sheet_latency_ms / 1000
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        journal_path = os.path.join(temp_dir, "journal.sqlite3")
+
+        config = Config()
+        config.storage.journal_path = journal_path
+        config.camera.framerate = fakes.camera_feed.framerate
+        config.metrics.http_port = 0
+
+        app = Application(config)
+        result = BenchmarkResult()
+
+        driver = Thread(
+            target=drive_visitors, args=(app, journal_path, args, result), daemon=True
+        )
+        driver.start()
+        # Returns once the driver quits the loop and the uploader has flushed
+        app.run()
+        driver.join()
+
+    for appended_at, person in fakes.spreadsheet_rows:
+        scanned_at = result.scanned_at.get(person.name)
+
+        if scanned_at is not None:
+            result.scan_to_sheet_secs.append((appended_at - scanned_at).total_seconds())
+
+    n_logged = len(result.scan_to_journal_secs)
+    throughput = n_logged / result.elapsed_secs * 60 if result.elapsed_secs > 0 else 0
+
+    log_info(f"Visitors: {args.visitors} ({result.n_timeouts} timed out)")
+    log_info(f"Throughput: {throughput:.1f} visitors/minute")
+    log_info(f"Scan to journal: {format_latencies(result.scan_to_journal_secs)}")
+    log_info(f"Scan to sheet: {format_latencies(result.scan_to_sheet_secs)}")
+
+    return 0 if result.n_timeouts == 0 else 1
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(
+        description="Drive the booth end-to-end on simulated devices and report "
+        "scan-to-log latency and throughput"
+    )
+    parser.add_argument(
+        "-n", "--visitors", type=int, default=50, help="Number of simulated visitors"
+    )
+    parser.add_argument(
+        "--hand-delay-ms",
+        type=int,
+        default=300,
+        help="Time between showing a code and putting a hand under the sensor",
+    )
+    parser.add_argument(
+        "--sheet-latency-ms",
+        type=int,
+        default=300,
+        help="Simulated round trip of each spreadsheet API call",
+    )
+    parser.add_argument(
+        "--timeout-secs",
+        type=float,
+        default=10.0,
+        help="How long to wait for a visitor to be logged before giving up",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
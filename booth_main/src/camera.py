@@ -1,7 +1,23 @@
-from gi.repository import GObject, Gst
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from datetime import time as dtime
+from typing import List, Optional, Tuple
 
+from gi.repository import GLib, GObject, Gst
+
+import backend
+import metrics
+from config import CameraConfig, ConfigError
 from utils import log_error, log_info
 
+FRAME_QUEUE_NAME = "frames"
+
+IDLE_MODES = ["low_fps", "paused"]
+WATCHDOG_INTERVAL_SECS = 1
+# Bytes compared between frames for motion; spread evenly over the frame
+MOTION_SAMPLE_SIZE = 4096
+
 
 class ElementNotFoundError(Exception):
     def __init__(self, element_name: str):
@@ -11,61 +27,493 @@ class ElementNotFoundError(Exception):
         return f"Element {self._element_name} not found"
 
 
+# A code decoded by zbar, which does not report where in the frame it was
+@dataclass(frozen=True)
+class Symbol:
+    data: str
+    # The zbar symbology name, such as `QR-Code`
+    type: str
+    quality: int
+
+
+# Compares an evenly spaced sample of each frame's bytes with the previous one
+class MotionDetector:
+    _previous: Optional[bytes] = None
+
+    def __init__(self, threshold: float):
+        self._threshold = threshold
+
+    def reset(self) -> None:
+        self._previous = None
+
+    def update(self, buffer: Gst.Buffer) -> bool:
+        # Returns whether the frame differs enough from the previous one
+        success, map_info = buffer.map(Gst.MapFlags.READ)
+
+        if not success:
+            return False
+
+        try:
+            data = map_info.data
+            sample = bytes(data[:: max(1, len(data) // MOTION_SAMPLE_SIZE)])
+        finally:
+            buffer.unmap(map_info)
+
+        previous = self._previous
+        self._previous = sample
+
+        if previous is None or len(previous) != len(sample):
+            return False
+
+        difference = sum(abs(a - b) for a, b in zip(sample, previous))
+        return difference / len(sample) > self._threshold
+
+
 class Camera(GObject.Object):
     __gsignals__ = {
-        "code-detected": (GObject.SIGNAL_RUN_LAST, None, (str,)),
+        # Emitted once per frame with every `Symbol` decoded from it
+        "codes-detected": (GObject.SIGNAL_RUN_LAST, None, (object,)),
         "error": (GObject.SIGNAL_RUN_LAST, None, ()),
     }
 
     _pipeline: Gst.Pipeline = None
     _bus: Gst.Bus = None
+    _bus_handler_id = None
+    _flush_id = None
+    _pending_running_time: Optional[int] = None
+    _watchdog_id = None
+    _restart_id = None
+    # When the pipeline last failed; cleared once frames flow again
+    _down_since: Optional[float] = None
+
+    # Read by the frame pad probe on the streaming thread
+    _is_idle = False
+    _is_recovery_pending = False
+    _last_frame_at = 0.0
+    # Set once the pipeline reports reaching PLAYING, which can take a while for the
+    # device to open; frames are only expected from then on
+    _is_playing = False
+    _woken_at: Optional[float] = None
+    _is_motion_pending = False
+    _last_idle_frame_at = 0.0
 
-    def __init__(self):
+    def __init__(self, config: CameraConfig):
         super().__init__()
 
-    def start(self):
+        self._config = config
+
+        if config.idle_mode not in IDLE_MODES:
+            raise ConfigError(
+                "camera.idle_mode",
+                f"expected one of {IDLE_MODES}, found `{config.idle_mode}`",
+            )
+
+        if config.idle_framerate <= 0:
+            raise ConfigError(
+                "camera.idle_framerate",
+                f"expected a positive framerate, found {config.idle_framerate}",
+            )
+
+        if config.idle_after_secs < 0:
+            raise ConfigError(
+                "camera.idle_after_secs",
+                f"expected 0 or more seconds, found {config.idle_after_secs}",
+            )
+
+        self._awake_hours = parse_awake_hours(config.awake_hours)
+        self._motion_detector = MotionDetector(config.motion_threshold)
+        self._last_activity_at = time.monotonic()
+        self._backoff_secs = config.recovery_initial_backoff_secs
+        # zbar posts one message per symbol; those of the same frame share a running time
+        self._pending_symbols: List[Symbol] = []
+        # Only written from the streaming thread by the frame pad probe
+        self._n_frames = 0
+        self._n_frames_at_last_decode = 0
+        self._n_frames_with_codes = 0
+
+    def preroll(self) -> None:
+        # Builds the pipeline and opens the device ahead of `start`
         if self._pipeline is None:
             self._setup_pipeline()
 
-        self._bus.add_signal_watch()
-        self._bus_handler_id = self._bus.connect("message", self._handle_message)
-        self._pipeline.set_state(Gst.State.PLAYING)
+        if self._bus_handler_id is None:
+            self._bus.add_signal_watch()
+            self._bus_handler_id = self._bus.connect("message", self._handle_message)
+
+        self._pipeline.set_state(Gst.State.PAUSED)
+
+    @property
+    def is_idle(self) -> bool:
+        return self._is_idle
+
+    @property
+    def is_down(self) -> bool:
+        return self._down_since is not None
+
+    def start(self):
+        # Starts capturing; failures are retried with backoff and reported by `error`
+        try:
+            self.preroll()
+        except Exception as error:
+            self._fail(f"Failed to build pipeline: {error}")
+            return
+
+        self._last_activity_at = time.monotonic()
+
+        if self._pipeline.set_state(Gst.State.PLAYING) == Gst.StateChangeReturn.FAILURE:
+            self._fail("Failed to set pipeline to playing")
+            return
+
+        if self._watchdog_id is None:
+            self._watchdog_id = GLib.timeout_add_seconds(
+                WATCHDOG_INTERVAL_SECS, self._on_watchdog
+            )
+
+        if self._down_since is None:
+            metrics.set_gauge("camera_up", 1)
+
         log_info("Camera started")
 
+    def wake(self, reason: str) -> None:
+        # Records activity, bringing the camera back to full rate if it is idle
+        self._last_activity_at = time.monotonic()
+
+        if not self._is_idle:
+            return
+
+        self._woken_at = self._last_frame_at = self._last_activity_at
+        self._is_idle = False
+
+        if self._config.idle_mode == "paused" and self._pipeline is not None:
+            self._pipeline.set_state(Gst.State.PLAYING)
+
+        metrics.increment("camera_wakes")
+        log_info(f"Camera woken by {reason}")
+
     def stop(self):
-        self._pipeline.set_state(Gst.State.NULL)
-        self._bus.disconnect(self._bus_handler_id)
-        self._bus.remove_signal_watch()
+        if self._restart_id is not None:
+            GLib.source_remove(self._restart_id)
+            self._restart_id = None
+
+        if self._watchdog_id is not None:
+            GLib.source_remove(self._watchdog_id)
+            self._watchdog_id = None
+
+        self._teardown()
+
+    def _teardown(self) -> None:
+        if self._pipeline is not None:
+            self._pipeline.set_state(Gst.State.NULL)
+
+        self._is_idle = False
+        self._is_playing = False
+
+        if self._flush_id is not None:
+            GLib.source_remove(self._flush_id)
+            self._flush_id = None
+
+        self._pending_symbols = []
+        self._pending_running_time = None
+
+        if self._bus_handler_id is not None:
+            self._bus.disconnect(self._bus_handler_id)
+            self._bus.remove_signal_watch()
+            self._bus_handler_id = None
+
+        # Rebuilt from scratch on restart so the device is opened again
+        self._pipeline = None
+        self._bus = None
+
+    def _fail(self, reason: str) -> None:
+        log_error(f"Camera failed: {reason}")
+        self._teardown()
+
+        if self._restart_id is not None:
+            return
+
+        if self._down_since is None:
+            self._down_since = time.monotonic()
+            metrics.increment("camera_failures")
+            metrics.set_gauge("camera_up", 0)
+            self.emit("error")
+
+        log_info(f"Restarting camera in {self._backoff_secs:.1f} seconds")
+        self._restart_id = GLib.timeout_add(
+            round(self._backoff_secs * 1000), self._on_restart
+        )
+        self._backoff_secs = min(
+            self._backoff_secs * 2, self._config.recovery_max_backoff_secs
+        )
+
+    def _on_restart(self) -> bool:
+        self._restart_id = None
+        metrics.increment("camera_restarts")
+        self.start()
+        return False
+
+    def _on_recovered(self) -> bool:
+        self._is_recovery_pending = False
+
+        if self._down_since is None:
+            return False
+
+        downtime_secs = time.monotonic() - self._down_since
+        self._down_since = None
+        self._backoff_secs = self._config.recovery_initial_backoff_secs
+
+        metrics.observe("camera_recovery", downtime_secs)
+        metrics.increment("camera_downtime_seconds", downtime_secs)
+        metrics.set_gauge("camera_up", 1)
+        log_info(f"Camera recovered after {downtime_secs:.1f} seconds")
+        return False
 
     def _handle_message(self, bus: Gst.Bus, message: Gst.Message) -> bool:
         if message.type == Gst.MessageType.ELEMENT:
-            symbol = message.get_structure().get_value("symbol")
-            if symbol is not None:
-                self.emit("code-detected", symbol)
+            structure = message.get_structure()
+            if structure.get_name() == "barcode":
+                self._add_symbol(structure)
             return True
 
         if message.type == Gst.MessageType.STATE_CHANGED:
             if message.src == self._pipeline:
                 old_state, new_state, pending = message.parse_state_changed()
                 log_info(f"Pipeline state set from {old_state} -> {new_state}")
+
+                # The stall clock starts here rather than when PLAYING was requested
+                self._is_playing = new_state == Gst.State.PLAYING
+
+                if self._is_playing:
+                    self._last_frame_at = time.monotonic()
             return True
 
         if message.type == Gst.MessageType.ERROR:
             error, debug = message.parse_error()
-            log_error(f"Error from message bus: {error} ({debug})")
-            self.stop()
-            self._pipeline = None
-            self.emit("error")
+            self._fail(f"Error from message bus: {error} ({debug})")
             return False
 
         return True
 
-    def _setup_pipeline(self) -> None:
-        self._pipeline = Gst.parse_launch(
-            "v4l2src ! video/x-raw, max-framerate=5/1 ! videoconvert ! zbar ! fakesink"
+    def _add_symbol(self, structure: Gst.Structure) -> None:
+        # The buffer timestamp is a PTS, which only matches the clock in running time
+        running_time = structure.get_value("running-time")
+
+        if running_time != self._pending_running_time:
+            self._flush_symbols()
+
+        self._pending_running_time = running_time
+        self._pending_symbols.append(
+            Symbol(
+                structure.get_value("symbol"),
+                structure.get_value("type"),
+                structure.get_value("quality"),
+            )
         )
+
+        # Idle sources run after the bus watch, so this waits for the rest of the frame
+        if self._flush_id is None:
+            self._flush_id = GLib.idle_add(self._on_flush_idle)
+
+    def _on_flush_idle(self) -> bool:
+        self._flush_id = None
+        self._flush_symbols()
+        return False
+
+    def _flush_symbols(self) -> None:
+        if len(self._pending_symbols) == 0:
+            return
+
+        symbols = self._pending_symbols
+        self._pending_symbols = []
+        # Codes are still decoded at the idle framerate
+        self.wake("code")
+        self._observe_decode_latency(self._pending_running_time)
+        self._observe_decode_rate(len(symbols))
+        self.emit("codes-detected", symbols)
+
+    def _observe_decode_rate(self, n_symbols: int) -> None:
+        n_frames = self._n_frames
+        self._n_frames_with_codes += 1
+
+        metrics.increment("frames_with_codes")
+        metrics.increment("symbols_decoded", n_symbols)
+        metrics.set_gauge("frames_per_decode", n_frames - self._n_frames_at_last_decode)
+        metrics.set_gauge("decode_rate", self._n_frames_with_codes / max(1, n_frames))
+
+        self._n_frames_at_last_decode = n_frames
+
+    def _on_watchdog(self) -> bool:
+        # Down and waiting to restart
+        if self._pipeline is None:
+            return True
+
+        if self._config.idle_after_secs > 0:
+            self._check_idle()
+
+        self._check_stall()
+        return True
+
+    def _check_idle(self) -> None:
+        if is_within_hours(datetime.now().time(), self._awake_hours):
+            self.wake("schedule")
+            return
+
+        idle_secs = time.monotonic() - self._last_activity_at
+
+        if not self._is_idle and idle_secs >= self._config.idle_after_secs:
+            self._idle()
+
+    def _check_stall(self) -> None:
+        timeout_secs = self._config.stall_timeout_secs
+
+        # A pipeline that is paused or still opening is not expected to produce frames
+        if timeout_secs <= 0 or not self._is_playing:
+            return
+
+        stalled_secs = time.monotonic() - self._last_frame_at
+
+        if stalled_secs > timeout_secs:
+            self._fail(f"No frames for {stalled_secs:.1f} seconds")
+
+    def _idle(self) -> None:
+        self._motion_detector.reset()
+        self._woken_at = None
+        self._is_idle = True
+
+        if self._config.idle_mode == "paused":
+            self._pipeline.set_state(Gst.State.PAUSED)
+
+        metrics.increment("camera_idles")
+        log_info(f"Camera idle after {self._config.idle_after_secs} seconds")
+
+    def _on_motion(self) -> bool:
+        self._is_motion_pending = False
+        self.wake("motion")
+        return False
+
+    def _on_frame(self, pad: Gst.Pad, info: Gst.PadProbeInfo) -> Gst.PadProbeReturn:
+        self._last_frame_at = time.monotonic()
+
+        if self._down_since is not None and not self._is_recovery_pending:
+            self._is_recovery_pending = True
+            GLib.idle_add(self._on_recovered)
+
+        woken_at = self._woken_at
+
+        if woken_at is not None:
+            self._woken_at = None
+            metrics.observe("camera_wake", time.monotonic() - woken_at)
+
+        if self._is_idle:
+            now = time.monotonic()
+
+            if now - self._last_idle_frame_at < 1 / self._config.idle_framerate:
+                return Gst.PadProbeReturn.DROP
+
+            self._last_idle_frame_at = now
+
+            is_moving = self._motion_detector.update(info.get_buffer())
+
+            if is_moving and not self._is_motion_pending:
+                self._is_motion_pending = True
+                GLib.idle_add(self._on_motion)
+
+        self._n_frames += 1
+        metrics.increment("frames_scanned")
+        return Gst.PadProbeReturn.OK
+
+    def _observe_decode_latency(self, frame_running_time: Optional[int]) -> None:
+        # Both are running time, so this is capture to decode
+        clock = self._pipeline.get_clock()
+
+        if frame_running_time is None or clock is None:
+            return
+
+        running_time = clock.get_time() - self._pipeline.get_base_time()
+        metrics.observe(
+            "frame_decode", max(0, running_time - frame_running_time) / Gst.SECOND
+        )
+
+    def _setup_pipeline(self) -> None:
+        description = build_pipeline_description(self._config)
+        log_info(f"Setting up pipeline `{description}`")
+        self._pipeline = Gst.parse_launch(description)
         self._bus = self._pipeline.get_bus()
 
+        # Frames dropped while idle then skip cropping and conversion, not only zbar
+        frame_queue = self._pipeline.get_by_name(FRAME_QUEUE_NAME)
+        frame_queue.get_static_pad("src").add_probe(
+            Gst.PadProbeType.BUFFER, self._on_frame
+        )
+        backend.on_pipeline_created(self._pipeline)
+
+
+def build_pipeline_description(config: CameraConfig) -> str:
+    elements: List[str] = [
+        backend.get_camera_source(config.device),
+        f"video/x-raw, max-framerate={config.framerate}/1",
+        # Decouples capture from decoding so a slow decode drops stale frames
+        # instead of letting them pile up
+        f"queue name={FRAME_QUEUE_NAME} leaky=downstream "
+        f"max-size-buffers={config.max_queued_frames} max-size-bytes=0 max-size-time=0",
+    ]
+
+    crop = (
+        config.crop_top,
+        config.crop_bottom,
+        config.crop_left,
+        config.crop_right,
+    )
+    if any(crop):
+        elements.append(
+            f"videocrop top={config.crop_top} bottom={config.crop_bottom} "
+            f"left={config.crop_left} right={config.crop_right}"
+        )
+
+    if config.scale_width > 0 and config.scale_height > 0:
+        elements.append("videoscale")
+        elements.append(
+            f"video/x-raw, width={config.scale_width}, height={config.scale_height}"
+        )
+
+    elements.append("videoconvert")
+
+    if config.grayscale:
+        elements.append("video/x-raw, format=GRAY8")
+
+    elements.append("zbar")
+    elements.append("fakesink sync=false")
+
+    return " ! ".join(elements)
+
+
+def parse_awake_hours(value: str) -> List[Tuple[dtime, dtime]]:
+    hours = []
+
+    for hour_range in value.split(","):
+        if hour_range.strip() == "":
+            continue
+
+        try:
+            start, end = hour_range.split("-")
+            hours.append(
+                (dtime.fromisoformat(start.strip()), dtime.fromisoformat(end.strip()))
+            )
+        except ValueError:
+            raise ConfigError(
+                "camera.awake_hours", f"expected HH:MM-HH:MM, found `{hour_range}`"
+            )
+
+    return hours
+
+
+def is_within_hours(now: dtime, hours: List[Tuple[dtime, dtime]]) -> bool:
+    for start, end in hours:
+        # Ranges that end before they start wrap around midnight
+        if start <= now < end or (end < start and (now >= start or now < end)):
+            return True
+
+    return False
+
 
 def make_gst_element(name: str) -> Gst.Element:
     element = Gst.ElementFactory.make(name)
@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import os
+from dataclasses import dataclass, field, fields, is_dataclass
+from typing import Any, Dict, Type
+
+DEFAULT_CONFIG_PATH = "./config.yaml"
+
+
+class ConfigError(Exception):
+    def __init__(self, key: str, reason: str):
+        self._key = key
+        self._reason = reason
+
+    def __str__(self):
+        return f"Invalid config key `{self._key}`: {self._reason}"
+
+
+@dataclass
+class ProximityConfig:
+    edge_detect: bool = True
+    debounce_ms: int = 300
+    poll_interval_ms: int = 250
+
+
+@dataclass
+class CheckInConfig:
+    # How long a scanned code waits for a hand under the sensor
+    hand_timeout_secs: float = 5.0
+    # How long to wait for the temperature reading before logging without one
+    measure_timeout_secs: float = 3.0
+    # How long temperature and greeting messages stay on the display
+    message_secs: int = 3
+
+
+@dataclass
+class CameraConfig:
+    device: str = ""  # empty uses v4l2src's default device
+    framerate: int = 10
+    grayscale: bool = True
+    # Pixels trimmed off each edge so only the scan window is decoded
+    crop_top: int = 0
+    crop_bottom: int = 0
+    crop_left: int = 0
+    crop_right: int = 0
+    # Zero keeps the (cropped) frame size
+    scale_width: int = 0
+    scale_height: int = 0
+    # Frames waiting for the decoder; older ones are dropped when full
+    max_queued_frames: int = 1
+    # Seconds without codes, proximity or motion before the camera idles; 0 disables
+    idle_after_secs: float = 120.0
+    # `low_fps` decodes idle_framerate frames a second and wakes on motion;
+    # `paused` stops capturing and only wakes on proximity or the schedule
+    idle_mode: str = "low_fps"
+    idle_framerate: float = 1.0
+    # Mean difference of sampled pixels (0-255) between idle frames that is motion
+    motion_threshold: float = 8.0
+    # Comma-separated HH:MM-HH:MM ranges in which the camera never idles
+    awake_hours: str = ""
+    # Seconds without frames before the pipeline is restarted; 0 disables
+    stall_timeout_secs: float = 5.0
+    # Delay before restarting a failed pipeline, doubled on every failed attempt
+    recovery_initial_backoff_secs: float = 1.0
+    recovery_max_backoff_secs: float = 60.0
+
+
+@dataclass
+class DedupConfig:
+    window_secs: float = 30.0
+    max_size: int = 128
+
+
+@dataclass
+class TemperatureConfig:
+    sample_rate_hz: int = 20
+    # How long the hand is sampled after the pump fires
+    window_ms: int = 500
+    # Fraction of the lowest and highest samples dropped before averaging
+    trim_ratio: float = 0.2
+    # reading += ambient_coefficient * (ambient_reference - ambient) + offset
+    ambient_reference: float = 25.0
+    ambient_coefficient: float = 0.0
+    offset: float = 0.0
+
+
+@dataclass
+class StorageConfig:
+    journal_path: str = "./journal.sqlite3"
+    spreadsheet_id: str = "1IA6YhAdkvdNkkPPyhCj5JQrB8dcaKZNWzk-4gI0Ea4Y"
+    upload_batch_size: int = 20
+    upload_batch_age_secs: float = 5.0
+    # `host:port` of the aggregator; empty appends to the spreadsheet directly
+    aggregator_address: str = ""
+    # Identifies this booth to the aggregator; empty uses the hostname
+    booth_id: str = ""
+
+
+@dataclass
+class RosterConfig:
+    # Excel or CSV file QR codes are generated from; empty disables validation
+    path: str = ""
+    # Reject codes that are not on the roster; ID-only codes always need it
+    reject_unknown: bool = False
+    reload_interval_secs: int = 10
+
+
+@dataclass
+class MetricsConfig:
+    # Serves Prometheus text at /metrics; 0 disables the endpoint
+    http_host: str = "127.0.0.1"
+    http_port: int = 0
+    # Periodically written in the same format; empty disables the dump
+    dump_path: str = ""
+    dump_interval_secs: int = 60
+
+
+@dataclass
+class LoggingConfig:
+    # Empty logs to stdout/stderr
+    path: str = ""
+    max_bytes: int = 1024 * 1024
+    backup_count: int = 3
+    flush_interval_secs: float = 1.0
+    # Recent records kept in memory and written to crash_path on a crash
+    ring_size: int = 500
+    crash_path: str = "./crash.log"
+
+
+@dataclass
+class Config:
+    proximity: ProximityConfig = field(default_factory=ProximityConfig)
+    check_in: CheckInConfig = field(default_factory=CheckInConfig)
+    camera: CameraConfig = field(default_factory=CameraConfig)
+    dedup: DedupConfig = field(default_factory=DedupConfig)
+    temperature: TemperatureConfig = field(default_factory=TemperatureConfig)
+    storage: StorageConfig = field(default_factory=StorageConfig)
+    roster: RosterConfig = field(default_factory=RosterConfig)
+    metrics: MetricsConfig = field(default_factory=MetricsConfig)
+    logging: LoggingConfig = field(default_factory=LoggingConfig)
+
+    @staticmethod
+    def load(path: str = DEFAULT_CONFIG_PATH) -> Config:
+        if not os.path.exists(path):
+            return Config()
+
+        # Deferred since it is only needed when there is a config file
+        import yaml
+
+        with open(path) as file:
+            data = yaml.safe_load(file) or {}
+
+        return _from_dict(Config, data, "")
+
+
+def _from_dict(cls: Type[Any], data: Dict[str, Any], prefix: str) -> Any:
+    instance = cls()
+    field_names = {f.name for f in fields(instance)}
+
+    if not isinstance(data, dict):
+        raise ConfigError(prefix or "<root>", "expected a mapping")
+
+    for key, value in data.items():
+        full_key = f"{prefix}{key}"
+
+        if key not in field_names:
+            raise ConfigError(full_key, "unknown key")
+
+        current = getattr(instance, key)
+
+        if is_dataclass(current):
+            value = _from_dict(type(current), value, f"{full_key}.")
+
+        setattr(instance, key, value)
+
+    return instance
@@ -0,0 +1,61 @@
+import time
+from collections import OrderedDict
+
+DEFAULT_WINDOW_SECS = 30.0
+DEFAULT_MAX_SIZE = 128
+
+
+class DedupCache:
+    def __init__(
+        self, window_secs: float = DEFAULT_WINDOW_SECS, max_size: int = DEFAULT_MAX_SIZE
+    ):
+        self._window_secs = window_secs
+        self._max_size = max_size
+        # Ordered from least to most recently seen
+        self._last_seen: OrderedDict[str, float] = OrderedDict()
+        self._n_hits = 0
+        self._n_misses = 0
+
+    @property
+    def n_hits(self) -> int:
+        return self._n_hits
+
+    @property
+    def n_misses(self) -> int:
+        return self._n_misses
+
+    def __len__(self) -> int:
+        return len(self._last_seen)
+
+    def check(self, key: str) -> bool:
+        # Returns whether `key` was already seen within the window. Seeing it again
+        # extends the window, so a code held in front of the camera stays suppressed
+        now = time.monotonic()
+        self._evict_expired(now)
+
+        is_duplicate = key in self._last_seen
+
+        if is_duplicate:
+            self._n_hits += 1
+            self._last_seen.move_to_end(key)
+        else:
+            self._n_misses += 1
+
+        self._last_seen[key] = now
+
+        if len(self._last_seen) > self._max_size:
+            self._last_seen.popitem(last=False)
+
+        return is_duplicate
+
+    def clear(self) -> None:
+        self._last_seen.clear()
+
+    def _evict_expired(self, now: float) -> None:
+        while len(self._last_seen) > 0:
+            key, seen_at = next(iter(self._last_seen.items()))
+
+            if now - seen_at < self._window_secs:
+                break
+
+            del self._last_seen[key]
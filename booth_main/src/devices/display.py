@@ -1,26 +1,41 @@
 from typing import List, Optional
 
-from rpi_lcd import LCD
 from gi.repository import GLib
 
+import backend
 from utils import log_warn
 
 DISPLAY_LENGTH = 16
 DISPLAY_HEIGHT = 2
 
+# HD44780 "set DDRAM address" commands for the start of each line
+LINE_ADDRESSES = [0x80, 0xC0]
+LCD_DATA_MODE = 1
+
+# Writes within this window are coalesced into a single flush
+FLUSH_DELAY_MS = 20
+
 
 class Display:
     _timeout_id = None
+    _flush_id = None
 
     def __init__(self, default_text: Optional[List[str]]):
-        self._inner = LCD(width=DISPLAY_LENGTH, rows=DISPLAY_HEIGHT)
+        self._inner = backend.create_lcd(DISPLAY_LENGTH, DISPLAY_HEIGHT)
         self._default_text = default_text
 
+        # What is on the glass and what should be, one character per cell;
+        # the LCD is cleared on initialization
+        self._shown = [[" "] * DISPLAY_LENGTH for _ in range(DISPLAY_HEIGHT)]
+        self._wanted = [[" "] * DISPLAY_LENGTH for _ in range(DISPLAY_HEIGHT)]
+
         if self._default_text is not None:
             self.write(self._default_text)
 
     def __del__(self):
-        self.clear()
+        # The LCD may have failed to open, which the application tolerates
+        if hasattr(self, "_inner"):
+            self.clear()
 
     def ephemeral_write(self, string_list: List[str], duration_secs: int) -> None:
         self.write(string_list)
@@ -36,21 +51,66 @@ class Display:
                 f"Trying to display multiple line of {len(string_list)} that cannot fit"
             )
 
-        for index, string in enumerate(string_list):
-            line_number = index + 1
-
+        for index, string in enumerate(string_list[:DISPLAY_HEIGHT]):
             if len(string) > DISPLAY_LENGTH:
                 log_warn(
                     f"Trying to display '{string}' of len {len(string)} that cannot fit"
                 )
 
-            self._inner.text(string, line_number)
+            self._wanted[index] = list(string[:DISPLAY_LENGTH].ljust(DISPLAY_LENGTH))
+
+        if self._flush_id is None:
+            self._flush_id = GLib.timeout_add(FLUSH_DELAY_MS, self._flush)
+
+    def flush(self) -> None:
+        # Writes pending changes now, for when the main loop is not running yet
+        if self._flush_id is not None:
+            GLib.source_remove(self._flush_id)
+
+        self._flush()
 
     def clear(self) -> None:
+        if self._flush_id is not None:
+            GLib.source_remove(self._flush_id)
+            self._flush_id = None
+
         self._inner.clear()
 
+        self._shown = [[" "] * DISPLAY_LENGTH for _ in range(DISPLAY_HEIGHT)]
+        self._wanted = [[" "] * DISPLAY_LENGTH for _ in range(DISPLAY_HEIGHT)]
+
     def reset(self) -> None:
         if self._default_text is not None:
             self.write(self._default_text)
         else:
             self.clear()
+
+    def _flush(self) -> bool:
+        self._flush_id = None
+
+        try:
+            for row in range(DISPLAY_HEIGHT):
+                self._flush_row(row)
+        except OSError as error:
+            log_warn(f"Failed to write to display: {error}")
+            # The LCD state is unknown now; redraw every cell on the next flush
+            self._shown = [[""] * DISPLAY_LENGTH for _ in range(DISPLAY_HEIGHT)]
+
+        return False
+
+    def _flush_row(self, row: int) -> None:
+        shown = self._shown[row]
+        wanted = self._wanted[row]
+        # The cursor auto-increments, so only a gap in the changed cells needs a seek
+        cursor = None
+
+        for column in range(DISPLAY_LENGTH):
+            if shown[column] == wanted[column]:
+                continue
+
+            if cursor != column:
+                self._inner.write(LINE_ADDRESSES[row] + column)
+
+            self._inner.write(ord(wanted[column]), LCD_DATA_MODE)
+            shown[column] = wanted[column]
+            cursor = column + 1
@@ -1,44 +1,79 @@
-from typing import Callable, Any
-
-import RPi.GPIO as GPIO
 from gi.repository import GObject, GLib
 
+import backend
+from utils import log_warn
+
+DEFAULT_DEBOUNCE_MS = 300
+DEFAULT_POLL_INTERVAL_MS = 250
+
 
 class ProximitySensor(GObject.Object):
     __gsignals__ = {"detected": (GObject.SIGNAL_RUN_LAST, None, ())}
 
-    _detected_handler_id = None
-    _timeout_handler_id = None
+    _is_edge_detect = False
+    _is_emit_pending = False
+    _was_active = False
 
-    def __init__(self, bcm_port: str):
+    def __init__(
+        self,
+        bcm_port: int,
+        edge_detect: bool = True,
+        debounce_ms: int = DEFAULT_DEBOUNCE_MS,
+        poll_interval_ms: int = DEFAULT_POLL_INTERVAL_MS,
+    ):
         super().__init__()
 
         self._bcm_port = bcm_port
+        self._gpio = backend.get_gpio()
+
+        self._gpio.setup(self._bcm_port, self._gpio.IN)
+
+        if edge_detect:
+            try:
+                self._gpio.add_event_detect(
+                    self._bcm_port,
+                    self._gpio.FALLING,
+                    callback=self._on_edge,
+                    bouncetime=debounce_ms,
+                )
+                self._is_edge_detect = True
+            except RuntimeError as error:
+                log_warn(
+                    f"Failed to set up edge detection on GPIO {self._bcm_port}, "
+                    f"falling back to polling: {error}"
+                )
+
+        if not self._is_edge_detect:
+            GLib.timeout_add(poll_interval_ms, self._check_for_input)
 
-        GPIO.setup(self._bcm_port, GPIO.IN)
-        GLib.timeout_add(250, self._check_for_input)
+    @property
+    def is_active(self) -> bool:
+        # The sensor pulls the line low while something is in front of it
+        return self._gpio.input(self._bcm_port) == 0
+
+    def check_level(self) -> None:
+        # Edges only report changes, so a wait that begins while a hand is already there
+        # would otherwise never see it
+        if self.is_active:
+            self._on_edge(self._bcm_port)
+
+    def _on_edge(self, channel: int) -> None:
+        # Called from the RPi.GPIO event thread; hand off to the main loop
+        if not self._is_emit_pending:
+            self._is_emit_pending = True
+            GLib.idle_add(self._emit_detected)
+
+    def _emit_detected(self) -> bool:
+        self._is_emit_pending = False
+        self.emit("detected")
+        return False
 
     def _check_for_input(self):
-        if GPIO.input(self._bcm_port) == 0:
+        is_active = self.is_active
+
+        # Like edge detection, only report something newly in front of the sensor
+        if is_active and not self._was_active:
             self.emit("detected")
-        return True
 
-    def wait_for_input(
-        self, timeout_secs: int, callback: Callable[[bool], None], *args: Any
-    ) -> None:
-        def callback_inner(is_timeout_reached: bool) -> bool:
-            if self._detected_handler_id is not None:
-                self.disconnect(self._detected_handler_id)
-                self._detected_handler_id = None
-
-            if self._timeout_handler_id is not None:
-                GLib.source_remove(self._timeout_handler_id)
-                self._timeout_handler_id = None
-
-            callback(is_timeout_reached, *args)
-            return False
-
-        self._detected_handler_id = self.connect(
-            "detected", lambda _: callback_inner(False)
-        )
-        self._timeout_handler_id = GLib.timeout_add_seconds(5, callback_inner, True)
+        self._was_active = is_active
+        return True
@@ -1,17 +1,138 @@
-from mlx90614 import MLX90614
-from smbus2.smbus2 import SMBus
+import math
+import statistics
+import time
+from collections import deque
+from threading import Event, Lock, Thread
+from typing import Callable, Deque, List, Optional
+
+from gi.repository import GLib
+
+import backend
+from utils import log_warn
+
+DEFAULT_SAMPLE_RATE_HZ = 20
+DEFAULT_WINDOW_MS = 500
+DEFAULT_TRIM_RATIO = 0.2
+
+TemperatureCallback = Callable[[Optional[float]], None]
 
 
 class TemperatureSensor:
-    def __init__(self):
-        self._bus = SMBus(1)
-        self._inner = MLX90614(self._bus)
+    _thread: Optional[Thread] = None
+
+    def __init__(
+        self,
+        sample_rate_hz: int = DEFAULT_SAMPLE_RATE_HZ,
+        window_ms: int = DEFAULT_WINDOW_MS,
+        trim_ratio: float = DEFAULT_TRIM_RATIO,
+        ambient_reference: float = 25.0,
+        ambient_coefficient: float = 0.0,
+        offset: float = 0.0,
+    ):
+        self._bus = backend.create_i2c_bus()
+        self._inner = backend.create_thermometer(self._bus)
+        self._bus_lock = Lock()
+
+        self._sample_interval_secs = 1 / sample_rate_hz
+        self._window_secs = window_ms / 1000
+        self._trim_ratio = trim_ratio
+        self._ambient_reference = ambient_reference
+        self._ambient_coefficient = ambient_coefficient
+        self._offset = offset
+
+        # Room for every sample of a window, plus the one taken at its start
+        self._samples: Deque[float] = deque(
+            maxlen=math.ceil(window_ms * sample_rate_hz / 1000) + 1
+        )
+        self._pending_callbacks: List[TemperatureCallback] = []
+        self._pending_lock = Lock()
+        self._request_event = Event()
 
     def __del__(self):
         self._bus.close()
 
     def get_object_temperature(self) -> float:
-        return self._inner.get_obj_temp()
+        with self._bus_lock:
+            return self._inner.get_obj_temp()
 
     def get_ambient_temperature(self) -> float:
-        return self._inner.get_amb_temp()
+        with self._bus_lock:
+            return self._inner.get_amb_temp()
+
+    def read_object_temperature_async(self, callback: TemperatureCallback) -> None:
+        # Samples over the configured window off the main loop, then calls `callback` on
+        # the main loop with the filtered reading, or None if every read failed
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="temperature", daemon=True)
+            self._thread.start()
+
+        with self._pending_lock:
+            self._pending_callbacks.append(callback)
+
+        self._request_event.set()
+
+    def _run(self) -> None:
+        while True:
+            self._request_event.wait()
+            self._request_event.clear()
+
+            with self._pending_lock:
+                callbacks = self._pending_callbacks
+                self._pending_callbacks = []
+
+            if len(callbacks) == 0:
+                continue
+
+            temperature = self._sample_window()
+
+            for callback in callbacks:
+                GLib.idle_add(_invoke_once, callback, temperature)
+
+    def _sample_window(self) -> Optional[float]:
+        self._samples.clear()
+        deadline = time.monotonic() + self._window_secs
+
+        while True:
+            try:
+                self._samples.append(self.get_object_temperature())
+            except OSError as error:
+                log_warn(
+                    f"Failed to read object temperature: {error}", stage="temperature"
+                )
+
+            if time.monotonic() + self._sample_interval_secs > deadline:
+                break
+
+            time.sleep(self._sample_interval_secs)
+
+        if len(self._samples) == 0:
+            return None
+
+        temperature = trimmed_mean(list(self._samples), self._trim_ratio)
+
+        try:
+            ambient = self.get_ambient_temperature()
+            temperature += self._ambient_coefficient * (
+                self._ambient_reference - ambient
+            )
+        except OSError as error:
+            log_warn(
+                f"Failed to read ambient temperature: {error}", stage="temperature"
+            )
+
+        return temperature + self._offset
+
+
+def trimmed_mean(samples: List[float], trim_ratio: float) -> float:
+    n_trimmed = int(len(samples) * trim_ratio)
+
+    if len(samples) - 2 * n_trimmed < 1:
+        return statistics.median(samples)
+
+    end = len(samples) - n_trimmed
+    return statistics.fmean(sorted(samples)[n_trimmed:end])
+
+
+def _invoke_once(callback: TemperatureCallback, temperature: Optional[float]) -> bool:
+    callback(temperature)
+    return False
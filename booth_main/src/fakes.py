@@ -0,0 +1,274 @@
+import random
+import time
+from datetime import datetime
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional, Tuple
+
+from gi.repository import Gst
+
+from person import Person
+from utils import log_info
+
+FAKE_CAMERA_SOURCE_NAME = "fake_camera"
+
+
+class FakeGPIO:
+    # Same values as RPi.GPIO
+    BCM = 11
+    BOARD = 10
+    OUT = 0
+    IN = 1
+    LOW = 0
+    HIGH = 1
+    RISING = 31
+    FALLING = 32
+    BOTH = 33
+
+    def __init__(self):
+        self._lock = Lock()
+        self._levels: Dict[int, int] = {}
+        self._event_detects: Dict[int, Tuple[int, Callable[[int], None], int]] = {}
+        self._last_event_at: Dict[int, float] = {}
+        self.output_history: List[Tuple[float, int, int]] = []
+
+    def setmode(self, mode: int) -> None:
+        pass
+
+    def setup(self, port: int, direction: int) -> None:
+        # Inputs idle high like the pulled-up proximity sensor
+        with self._lock:
+            self._levels.setdefault(port, self.HIGH)
+
+    def input(self, port: int) -> int:
+        with self._lock:
+            return self._levels.get(port, self.HIGH)
+
+    def output(self, port: int, value: int) -> None:
+        with self._lock:
+            self._levels[port] = value
+            self.output_history.append((time.monotonic(), port, value))
+
+    def add_event_detect(
+        self,
+        port: int,
+        edge: int,
+        callback: Callable[[int], None],
+        bouncetime: int = 0,
+    ) -> None:
+        with self._lock:
+            if port in self._event_detects:
+                raise RuntimeError("Conflicting edge detection already enabled")
+
+            self._event_detects[port] = (edge, callback, bouncetime)
+
+    def remove_event_detect(self, port: int) -> None:
+        with self._lock:
+            self._event_detects.pop(port, None)
+
+    def cleanup(self) -> None:
+        with self._lock:
+            self._levels.clear()
+            self._event_detects.clear()
+            self._last_event_at.clear()
+
+    def set_input(self, port: int, value: int) -> None:
+        # Drives an input pin, calling edge callbacks from the caller's thread
+        with self._lock:
+            old_value = self._levels.get(port, self.HIGH)
+            self._levels[port] = value
+            event_detect = self._event_detects.get(port)
+
+            if event_detect is None or old_value == value:
+                return
+
+            edge, callback, bouncetime = event_detect
+            is_rising = value == self.HIGH
+
+            if edge == self.RISING and not is_rising:
+                return
+
+            if edge == self.FALLING and is_rising:
+                return
+
+            now = time.monotonic()
+            last_event_at = self._last_event_at.get(port)
+
+            if last_event_at is not None and now - last_event_at < bouncetime / 1000:
+                return
+
+            self._last_event_at[port] = now
+
+        callback(port)
+
+
+class FakeLCD:
+    CLEAR_DISPLAY = 0x01
+    SET_DDRAM_ADDRESS = 0x80
+    LINE_OFFSETS = [0x00, 0x40, 0x14, 0x54]
+
+    def __init__(self, width: int, rows: int):
+        self._width = width
+        self._rows = rows
+        self._cells = [[" "] * width for _ in range(rows)]
+        self._cursor = (0, 0)
+        self.n_writes = 0
+
+    @property
+    def lines(self) -> List[str]:
+        return ["".join(row) for row in self._cells]
+
+    def write(self, byte: int, mode: int = 0) -> None:
+        self.n_writes += 1
+
+        if mode == 0:
+            self._command(byte)
+            return
+
+        row, column = self._cursor
+
+        if row < self._rows and column < self._width:
+            self._cells[row][column] = chr(byte)
+
+        self._cursor = (row, column + 1)
+
+    def text(self, text: str, line: int) -> None:
+        self.write(self.SET_DDRAM_ADDRESS | self.LINE_OFFSETS[line - 1])
+
+        for char in text.ljust(self._width):
+            self.write(ord(char), 1)
+
+    def clear(self) -> None:
+        self.write(self.CLEAR_DISPLAY)
+
+    def _command(self, byte: int) -> None:
+        if byte == self.CLEAR_DISPLAY:
+            self._cells = [[" "] * self._width for _ in range(self._rows)]
+            self._cursor = (0, 0)
+            return
+
+        if byte & self.SET_DDRAM_ADDRESS:
+            address = byte & ~self.SET_DDRAM_ADDRESS
+
+            # Line offsets are not in row order, so pick the closest one below
+            row, offset = max(
+                (
+                    (row, offset)
+                    for row, offset in enumerate(self.LINE_OFFSETS[: self._rows])
+                    if offset <= address
+                ),
+                key=lambda row_offset: row_offset[1],
+            )
+            self._cursor = (row, address - offset)
+
+
+class FakeSMBus:
+    def __init__(self, bus: int):
+        self._bus = bus
+
+    def close(self) -> None:
+        pass
+
+
+class FakeThermometer:
+    def __init__(self):
+        self._lock = Lock()
+        self._script: List[float] = []
+        self.object_temperature = 36.6
+        self.ambient_temperature = 25.0
+        self.noise = 0.2
+        # Roughly what an SMBus word read costs at 100 kHz
+        self.read_delay_secs = 0.001
+
+    def script(self, temperatures: List[float]) -> None:
+        # Queues object temperatures to return before falling back to the default
+        with self._lock:
+            self._script.extend(temperatures)
+
+    def get_obj_temp(self) -> float:
+        time.sleep(self.read_delay_secs)
+
+        with self._lock:
+            if len(self._script) > 0:
+                return self._script.pop(0)
+
+        return random.gauss(self.object_temperature, self.noise)
+
+    def get_amb_temp(self) -> float:
+        time.sleep(self.read_delay_secs)
+        return self.ambient_temperature
+
+
+# Feeds GRAY8 frames through an appsrc, repeating the last one passed to `show` at the
+# feed framerate like a camera
+class FakeCameraFeed:
+    _appsrc: Optional[Gst.Element] = None
+    _thread: Optional[Thread] = None
+
+    def __init__(self, width: int = 320, height: int = 240, framerate: int = 10):
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self._blank_frame = bytes([255]) * (width * height)
+        self._frame = self._blank_frame
+
+    def source_description(self) -> str:
+        return (
+            f"appsrc name={FAKE_CAMERA_SOURCE_NAME} is-live=true do-timestamp=true "
+            f"format=time caps=video/x-raw,format=GRAY8,width={self.width},"
+            f"height={self.height},framerate={self.framerate}/1"
+        )
+
+    def attach(self, pipeline: Gst.Pipeline) -> None:
+        self._appsrc = pipeline.get_by_name(FAKE_CAMERA_SOURCE_NAME)
+
+        if self._thread is None:
+            self._thread = Thread(target=self._run, name="fake-camera", daemon=True)
+            self._thread.start()
+
+    def show(self, frame: bytes) -> None:
+        if len(frame) != self.width * self.height:
+            raise ValueError(f"Expected a {self.width}x{self.height} GRAY8 frame")
+
+        self._frame = frame
+
+    def clear(self) -> None:
+        self._frame = self._blank_frame
+
+    def _run(self) -> None:
+        interval_secs = 1 / self.framerate
+
+        while True:
+            appsrc = self._appsrc
+
+            if appsrc is not None:
+                appsrc.emit("push-buffer", Gst.Buffer.new_wrapped(self._frame))
+
+            time.sleep(interval_secs)
+
+
+class FakeSpreadsheet:
+    def __init__(self, id: str):
+        self._id = id
+        time.sleep(spreadsheet_latency_secs)
+
+    def append_person(self, person: Person) -> None:
+        self.append_persons([person])
+
+    def append_persons(self, persons: List[Person]) -> None:
+        time.sleep(spreadsheet_latency_secs)
+
+        with _spreadsheet_lock:
+            appended_at = datetime.now()
+            spreadsheet_rows.extend((appended_at, person) for person in persons)
+
+        log_info(f"Appended {len(persons)} Person(s) to fake spreadsheet {self._id}")
+
+
+gpio = FakeGPIO()
+thermometer = FakeThermometer()
+camera_feed = FakeCameraFeed()
+
+# Simulated round trip of a Sheets API call
+spreadsheet_latency_secs = 0.3
+spreadsheet_rows: List[Tuple[datetime, Person]] = []
+_spreadsheet_lock = Lock()
@@ -0,0 +1,141 @@
+import sqlite3
+from datetime import date, datetime, time, timedelta
+from threading import Lock
+from typing import Iterator, List, Tuple
+
+from person import Person
+
+DEFAULT_JOURNAL_PATH = "./journal.sqlite3"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS check_ins (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    name TEXT NOT NULL,
+    address TEXT NOT NULL,
+    contact_number TEXT NOT NULL,
+    room_id TEXT NOT NULL,
+    temperature REAL NOT NULL,
+    time_detected TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS check_ins_time_detected ON check_ins (time_detected);
+CREATE INDEX IF NOT EXISTS check_ins_room_id ON check_ins (room_id, time_detected);
+CREATE INDEX IF NOT EXISTS check_ins_temperature ON check_ins (temperature);
+CREATE TRIGGER IF NOT EXISTS check_ins_no_update BEFORE UPDATE ON check_ins
+BEGIN
+    SELECT RAISE(ABORT, 'check_ins is append-only');
+END;
+CREATE TRIGGER IF NOT EXISTS check_ins_no_delete BEFORE DELETE ON check_ins
+BEGIN
+    SELECT RAISE(ABORT, 'check_ins is append-only');
+END;
+CREATE TABLE IF NOT EXISTS sync_cursors (
+    name TEXT PRIMARY KEY,
+    last_id INTEGER NOT NULL
+);
+"""
+
+_COLUMNS = "id, name, address, contact_number, room_id, temperature, time_detected"
+
+
+class Journal:
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        self._lock = Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        # Check-ins must survive the daily power cycle, not just a process crash
+        self._connection.execute("PRAGMA synchronous=FULL")
+        self._connection.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        with self._lock:
+            self._connection.close()
+
+    def append(self, person: Person) -> int:
+        with self._lock, self._connection:
+            cursor = self._connection.execute(
+                "INSERT INTO check_ins "
+                "(name, address, contact_number, room_id, temperature, time_detected) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    str(person.name),
+                    str(person.address),
+                    str(person.contact_number),
+                    str(person.room_id),
+                    float(person.temperature),
+                    person.time_detected.isoformat(),
+                ),
+            )
+            return cursor.lastrowid or 0
+
+    def get_unsynced(self, cursor_name: str, limit: int) -> List[Tuple[int, Person]]:
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {_COLUMNS} FROM check_ins WHERE id > ? ORDER BY id LIMIT ?",
+                (self._get_cursor(cursor_name), limit),
+            ).fetchall()
+
+        return [(row[0], _row_to_person(row)) for row in rows]
+
+    def count_unsynced(self, cursor_name: str) -> int:
+        with self._lock:
+            (count,) = self._connection.execute(
+                "SELECT COUNT(*) FROM check_ins WHERE id > ?",
+                (self._get_cursor(cursor_name),),
+            ).fetchone()
+
+        return count
+
+    def advance_cursor(self, cursor_name: str, last_id: int) -> None:
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT INTO sync_cursors (name, last_id) VALUES (?, ?) "
+                "ON CONFLICT (name) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)",
+                (cursor_name, last_id),
+            )
+
+    def get_persons_between(self, start: datetime, end: datetime) -> List[Person]:
+        with self._lock:
+            rows = self._connection.execute(
+                f"SELECT {_COLUMNS} FROM check_ins "
+                "WHERE time_detected >= ? AND time_detected < ? ORDER BY time_detected",
+                (start.isoformat(), end.isoformat()),
+            ).fetchall()
+
+        return [_row_to_person(row) for row in rows]
+
+    def get_persons_on(self, day: date) -> List[Person]:
+        start = datetime.combine(day, time())
+        return self.get_persons_between(start, start + timedelta(days=1))
+
+    def _get_cursor(self, cursor_name: str) -> int:
+        row = self._connection.execute(
+            "SELECT last_id FROM sync_cursors WHERE name = ?", (cursor_name,)
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+
+def read_check_ins(path: str, batch_size: int = 10000) -> Iterator[tuple]:
+    # Yields `(id, name, address, contact_number, room_id, temperature, time_detected)`
+    # rows in time order. Opened read-only, so this is safe while the booth is running
+    connection = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    try:
+        cursor = connection.execute(
+            f"SELECT {_COLUMNS} FROM check_ins ORDER BY time_detected"
+        )
+
+        while True:
+            rows = cursor.fetchmany(batch_size)
+
+            if len(rows) == 0:
+                return
+
+            yield from rows
+    finally:
+        connection.close()
+
+
+def _row_to_person(row: tuple) -> Person:
+    return Person(
+        row[1], row[2], row[3], row[4], row[5], datetime.fromisoformat(row[6])
+    )
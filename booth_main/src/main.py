@@ -1,25 +1,85 @@
-import RPi.GPIO as GPIO
+import importlib
+import threading
+import time
+import traceback
 
 import gi
 
 gi.require_version("Gst", "1.0")
-from gi.repository import Gst
 
+import backend
 from application import Application
-from utils import log_info
+from config import Config
+from utils import log_error, log_info, log_warn, logger
 
+# Imported off the main thread once the booth is up so the first check-in that needs
+# them does not pay for it
+WARM_UP_MODULES = ["yaml"]
+
+
+def dump_crash_log(path: str) -> None:
+    try:
+        with open(path, "w") as file:
+            logger.dump_recent(file)
+    except OSError as error:
+        log_error(f"Failed to write crash log to `{path}`: {error}")
+
+
+def log_thread_exception(args: threading.ExceptHookArgs) -> None:
+    thread_name = args.thread.name if args.thread is not None else "unknown"
+    log_error(
+        f"Unhandled exception in thread `{thread_name}`",
+        traceback="".join(
+            traceback.format_exception(
+                args.exc_type, args.exc_value, args.exc_traceback
+            )
+        ),
+    )
 
-def main():
-    Gst.init(None)
 
-    GPIO.setmode(GPIO.BCM)
+def warm_up() -> None:
+    started_at = time.monotonic()
+
+    for name in WARM_UP_MODULES:
+        try:
+            importlib.import_module(name)
+        except ImportError as error:
+            log_warn(f"Failed to import `{name}` ahead of time: {error}")
+
+    log_info(
+        f"Warmed up in {time.monotonic() - started_at:.3f} seconds",
+        stage="startup",
+        modules=WARM_UP_MODULES,
+    )
+
+
+def main():
+    config = Config.load()
+    logger.configure(
+        config.logging.path,
+        config.logging.max_bytes,
+        config.logging.backup_count,
+        config.logging.flush_interval_secs,
+        config.logging.ring_size,
+    )
+    threading.excepthook = log_thread_exception
 
-    app = Application()
+    gpio = backend.get_gpio()
+    gpio.setmode(gpio.BCM)
 
-    log_info("Application is now running")
-    app.run()
+    try:
+        app = Application(config)
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
 
-    GPIO.cleanup()
+        log_info("Application is now running")
+        app.run()
+    except Exception:
+        log_error("Application crashed", traceback=traceback.format_exc())
+        dump_crash_log(config.logging.crash_path)
+        raise
+    finally:
+        gpio.cleanup()
+        logger.flush()
 
 
 if __name__ == "__main__":
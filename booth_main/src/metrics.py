@@ -0,0 +1,187 @@
+import os
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Lock, Thread
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from utils import log_info
+
+# Upper bounds in seconds, spanning a fast I2C read to a stalled API call
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+METRIC_PREFIX = "booth"
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self._buckets = buckets
+        self._counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.sum += value
+        self.count += 1
+
+        for index, bound in enumerate(self._buckets):
+            if value <= bound:
+                self._counts[index] += 1
+                break
+
+    def cumulative_counts(self) -> List[Tuple[float, int]]:
+        counts = []
+        total = 0
+
+        for bound, count in zip(self._buckets, self._counts):
+            total += count
+            counts.append((bound, total))
+
+        return counts
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = Lock()
+        self._stages: Dict[str, Histogram] = {}
+        self._counters: Dict[str, float] = {}
+        self._gauges: Dict[str, float] = {}
+
+    def observe(self, stage: str, seconds: float) -> None:
+        with self._lock:
+            histogram = self._stages.get(stage)
+
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram()
+
+            histogram.observe(seconds)
+
+    def increment(self, name: str, amount: float = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def set_gauge(self, name: str, value: float) -> None:
+        with self._lock:
+            self._gauges[name] = value
+
+    def render(self) -> str:
+        # Renders every metric in the Prometheus text exposition format
+        lines = []
+
+        with self._lock:
+            if len(self._stages) > 0:
+                name = f"{METRIC_PREFIX}_stage_duration_seconds"
+                lines.append(f"# TYPE {name} histogram")
+
+                for stage, histogram in sorted(self._stages.items()):
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append(
+                            f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}'
+                        )
+
+                    lines.append(
+                        f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}'
+                    )
+                    lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                    lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+            for counter, value in sorted(self._counters.items()):
+                name = f"{METRIC_PREFIX}_{counter}_total"
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {value}")
+
+            for gauge, value in sorted(self._gauges.items()):
+                name = f"{METRIC_PREFIX}_{gauge}"
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str) -> None:
+        temp_path = f"{path}.tmp"
+
+        with open(temp_path, "w") as file:
+            file.write(self.render())
+
+        os.replace(temp_path, path)
+
+
+class MetricsServer:
+    _thread: Optional[Thread] = None
+
+    def __init__(self, metrics: Metrics, host: str, port: int):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+
+                body = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._host = host
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+
+    def start(self) -> None:
+        port = self._server.server_address[1]
+        self._thread = Thread(
+            target=self._server.serve_forever, name="metrics-server", daemon=True
+        )
+        self._thread.start()
+        log_info(f"Serving metrics at http://{self._host}:{port}/metrics")
+
+    def stop(self) -> None:
+        if self._thread is None:
+            return
+
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread = None
+
+
+registry = Metrics()
+
+
+def observe(stage: str, seconds: float) -> None:
+    registry.observe(stage, seconds)
+
+
+def increment(name: str, amount: float = 1) -> None:
+    registry.increment(name, amount)
+
+
+def set_gauge(name: str, value: float) -> None:
+    registry.set_gauge(name, value)
+
+
+@contextmanager
+def time_stage(stage: str) -> Iterator[None]:
+    start = time.monotonic()
+
+    try:
+        yield
+    finally:
+        observe(stage, time.monotonic() - start)
@@ -0,0 +1,108 @@
+import base64
+import hashlib
+import re
+from typing import List
+
+# generate_qr_code imports this module too, so the codes it renders and the roster
+# index at the booth always agree
+
+# Compact QR payload: `B1|name|address|contact_number|room_id`, where `\` escapes
+# a literal `|` or `\` inside a field
+PAYLOAD_VERSION = "B1"
+PAYLOAD_SEPARATOR = "|"
+PAYLOAD_ESCAPE = "\\"
+PAYLOAD_N_FIELDS = 4
+
+# ID-only QR payload: `I1:id`, resolved against the roster at the booth. Generated IDs
+# stay within the QR alphanumeric charset, which makes for the smallest codes
+ID_PAYLOAD_PREFIX = "I1:"
+ID_DIGEST_SIZE = 10
+
+# Stripped from contact numbers, so `0917-123 4567` and `09171234567` are one person
+CONTACT_NUMBER_PUNCTUATION = r"[\s\-()]"
+
+
+def normalize_text(value: str) -> str:
+    return " ".join(value.split())
+
+
+def normalize_contact_number(value: str) -> str:
+    return re.sub(CONTACT_NUMBER_PUNCTUATION, "", normalize_text(value))
+
+
+def encode_payload(name: str, address: str, contact_number: str, room_id: str) -> str:
+    fields = [PAYLOAD_VERSION]
+
+    for field in (name, address, contact_number, room_id):
+        fields.append(
+            str(field)
+            .replace(PAYLOAD_ESCAPE, PAYLOAD_ESCAPE * 2)
+            .replace(PAYLOAD_SEPARATOR, PAYLOAD_ESCAPE + PAYLOAD_SEPARATOR)
+        )
+
+    return PAYLOAD_SEPARATOR.join(fields)
+
+
+def is_id_payload(payload: str) -> bool:
+    return payload.startswith(ID_PAYLOAD_PREFIX)
+
+
+def encode_id_payload(id: str) -> str:
+    return ID_PAYLOAD_PREFIX + id
+
+
+def decode_id_payload(payload: str) -> str:
+    if not is_id_payload(payload):
+        raise ValueError(f"Not an ID payload `{payload}`")
+
+    _, _, id = payload.partition(ID_PAYLOAD_PREFIX)
+    return id
+
+
+def roster_id(name: str, contact_number: str) -> str:
+    # Derives the ID of a roster row that has none of its own
+    digest = hashlib.sha256(
+        f"{name}{PAYLOAD_SEPARATOR}{contact_number}".encode()
+    ).digest()
+    return base64.b32encode(digest[:ID_DIGEST_SIZE]).decode()
+
+
+def decode_payload(payload: str) -> List[str]:
+    if PAYLOAD_ESCAPE in payload:
+        fields = _split_escaped(payload)
+    else:
+        fields = payload.split(PAYLOAD_SEPARATOR)
+
+    if fields[0] != PAYLOAD_VERSION:
+        raise ValueError(f"Unsupported payload version `{fields[0]}`")
+
+    if len(fields) != PAYLOAD_N_FIELDS + 1:
+        raise ValueError(
+            f"Expected {PAYLOAD_N_FIELDS} payload fields, found {len(fields) - 1}"
+        )
+
+    return fields[1:]
+
+
+def _split_escaped(payload: str) -> List[str]:
+    fields = []
+    current: List[str] = []
+    is_escaped = False
+
+    for char in payload:
+        if is_escaped:
+            current.append(char)
+            is_escaped = False
+        elif char == PAYLOAD_ESCAPE:
+            is_escaped = True
+        elif char == PAYLOAD_SEPARATOR:
+            fields.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+
+    if is_escaped:
+        raise ValueError("Payload ends with a dangling escape")
+
+    fields.append("".join(current))
+    return fields
@@ -3,7 +3,10 @@ from __future__ import annotations
 from dataclasses import dataclass
 from datetime import datetime
 
-import yaml
+from payload import PAYLOAD_SEPARATOR, PAYLOAD_VERSION, decode_payload, is_id_payload
+
+# Stands in for every detail of a visitor who had their temperature taken without a code
+ANONYMOUS = "Unknown"
 
 
 class PersonParseError(Exception):
@@ -25,24 +28,39 @@ class Person:
     time_detected: datetime
 
     @staticmethod
-    def from_str(string: str) -> Person:
+    def from_code(code: str, time_detected: datetime, temperature: float) -> Person:
+        if is_id_payload(code):
+            raise PersonParseError(ValueError("ID-only codes need a roster"), code)
+
+        if not code.startswith(PAYLOAD_VERSION + PAYLOAD_SEPARATOR):
+            return Person._from_legacy_code(code, time_detected, temperature)
+
         try:
-            data = yaml.safe_load(string)
+            name, address, contact_number, room_id = decode_payload(code)
+        except ValueError as error:
+            raise PersonParseError(error, code)
 
-            time_detected_data = data["time_detected"]
-            time_detected = (
-                datetime.fromisoformat(time_detected_data)
-                if isinstance(time_detected_data, str)
-                else time_detected_data
-            )
+        return Person(
+            name, address, contact_number, room_id, temperature, time_detected
+        )
+
+    @staticmethod
+    def _from_legacy_code(
+        code: str, time_detected: datetime, temperature: float
+    ) -> Person:
+        # Deferred as only old codes need it; see `warm_up` in main.py
+        import yaml
+
+        try:
+            data = yaml.safe_load(code)
 
             return Person(
                 data["name"],
                 data["address"],
                 data["contact_number"],
                 data["room_id"],
-                float(data["temperature"]),
+                temperature,
                 time_detected,
             )
-        except (ValueError, KeyError, yaml.scanner.ScannerError) as error:
-            raise PersonParseError(error, string)
+        except (KeyError, TypeError, yaml.YAMLError) as error:
+            raise PersonParseError(error, code)
@@ -0,0 +1,176 @@
+import csv
+import hashlib
+import os
+from dataclasses import dataclass
+from threading import Thread
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from payload import (
+    decode_id_payload,
+    encode_payload,
+    is_id_payload,
+    normalize_contact_number,
+    normalize_text,
+    roster_id,
+)
+from utils import log_error, log_info
+
+# Matched case-insensitively against the header row, like in generate_qr_code
+COLUMNS = ["name", "address", "contact number", "room id"]
+# Optional; rows without one get an ID derived from their name and contact number
+ID_COLUMN = "id"
+
+PAYLOAD_DIGEST_SIZE = 8
+
+
+class RosterError(Exception):
+    def __init__(self, path: str, reason: str):
+        self._path = path
+        self._reason = reason
+
+    def __str__(self):
+        return f"Invalid roster `{self._path}`: {self._reason}"
+
+
+@dataclass(frozen=True)
+class RosterEntry:
+    id: str
+    name: str
+    address: str
+    contact_number: str
+    room_id: str
+
+
+# Index of the Excel or CSV file that QR codes are generated from. Codes are looked up
+# by ID for ID-only payloads and by a digest of the payload otherwise, so neither is
+# parsed
+class Roster:
+    _mtime: Optional[float] = None
+    _loader: Optional[Thread] = None
+    _is_loaded = False
+
+    def __init__(self, path: str):
+        self._path = path
+        # Replaced as a whole on reload so lookups never see a half-built index
+        self._index: Tuple[Dict[str, RosterEntry], Dict[bytes, RosterEntry]] = ({}, {})
+
+    def __len__(self) -> int:
+        by_id, _ = self._index
+        return len(by_id)
+
+    @property
+    def is_loaded(self) -> bool:
+        # Until then a failed lookup does not mean the code is unknown
+        return self._is_loaded
+
+    def lookup(self, code: str) -> Optional[RosterEntry]:
+        by_id, by_payload_digest = self._index
+
+        if is_id_payload(code):
+            return by_id.get(decode_id_payload(code))
+
+        return by_payload_digest.get(_payload_digest(code))
+
+    def load(self) -> None:
+        by_id: Dict[str, RosterEntry] = {}
+        by_payload_digest: Dict[bytes, RosterEntry] = {}
+
+        for entry in read_roster(self._path):
+            by_id[entry.id] = entry
+            payload = encode_payload(
+                entry.name, entry.address, entry.contact_number, entry.room_id
+            )
+            by_payload_digest[_payload_digest(payload)] = entry
+
+        self._index = (by_id, by_payload_digest)
+        self._is_loaded = True
+        log_info(f"Loaded {len(by_id)} roster entries from `{self._path}`")
+
+    def reload_if_changed(self) -> None:
+        # Reloads on a background thread if the file changed since it was last read
+        try:
+            mtime = os.stat(self._path).st_mtime
+        except OSError as error:
+            if self._mtime is not None:
+                log_error(f"Failed to check roster for changes: {error}")
+                self._mtime = None
+            return
+
+        if mtime == self._mtime or (
+            self._loader is not None and self._loader.is_alive()
+        ):
+            return
+
+        # Recorded up front so a broken file is retried only once it changes again
+        self._mtime = mtime
+        self._loader = Thread(
+            target=self._load_in_background, name="roster-loader", daemon=True
+        )
+        self._loader.start()
+
+    def _load_in_background(self) -> None:
+        try:
+            self.load()
+        except (OSError, RosterError) as error:
+            log_error(f"Failed to load roster: {error}")
+
+
+def read_roster(path: str) -> Iterator[RosterEntry]:
+    if path.lower().endswith(".csv"):
+        with open(path, newline="") as file:
+            yield from _entries_from_rows(path, csv.reader(file))
+        return
+
+    try:
+        import openpyxl
+    except ImportError:
+        raise RosterError(path, "reading Excel files requires openpyxl")
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+
+    try:
+        yield from _entries_from_rows(path, workbook.active.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+
+
+def _entries_from_rows(path: str, rows: Iterator[Any]) -> Iterator[RosterEntry]:
+    header = [_cell_to_str(cell).strip().lower() for cell in next(rows, [])]
+
+    try:
+        indices = [header.index(column) for column in COLUMNS]
+    except ValueError:
+        raise RosterError(path, f"expected columns {COLUMNS}, found {header}")
+
+    id_index = header.index(ID_COLUMN) if ID_COLUMN in header else None
+
+    for row in rows:
+        cells: List[str] = [_cell_to_str(cell) for cell in row]
+
+        if all(cell == "" for cell in cells):
+            continue
+
+        cells += [""] * (len(header) - len(cells))
+        name, address, contact_number, room_id = [cells[index] for index in indices]
+        contact_number = normalize_contact_number(contact_number)
+        id = cells[id_index] if id_index is not None else ""
+
+        if id == "":
+            id = roster_id(name, contact_number)
+
+        yield RosterEntry(id, name, address, contact_number, room_id)
+
+
+def _cell_to_str(cell: Any) -> str:
+    if cell is None:
+        return ""
+
+    # Excel stores contact numbers as floats
+    if isinstance(cell, float) and cell.is_integer():
+        return str(int(cell))
+
+    return normalize_text(str(cell))
+
+
+def _payload_digest(payload: str) -> bytes:
+    return hashlib.blake2b(payload.encode(), digest_size=PAYLOAD_DIGEST_SIZE).digest()
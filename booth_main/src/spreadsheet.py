@@ -1,3 +1,5 @@
+from typing import List
+
 import gspread
 
 from person import Person
@@ -16,17 +18,23 @@ class Spreadsheet:
             authorized_user_filename=AUTHORIZED_PATH,
         )
         self._inner = client.open_by_key(id)
+        self._worksheet = self._inner.get_worksheet(0)
 
     def append_person(self, person: Person) -> None:
-        worksheet = self._inner.get_worksheet(0)
-        worksheet.append_row(
+        self.append_persons([person])
+
+    def append_persons(self, persons: List[Person]) -> None:
+        self._worksheet.append_rows(
             [
-                person.name,
-                person.address,
-                person.contact_number,
-                person.room_id,
-                str(person.temperature),
-                str(person.time_detected),
+                [
+                    person.name,
+                    person.address,
+                    person.contact_number,
+                    person.room_id,
+                    str(person.temperature),
+                    str(person.time_detected),
+                ]
+                for person in persons
             ]
         )
-        log_info(f"Appended Person {person}")
+        log_info(f"Appended {len(persons)} Person(s) {persons}")
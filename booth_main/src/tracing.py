@@ -0,0 +1,371 @@
+import sys
+from argparse import ArgumentParser, Namespace
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from journal import read_check_ins
+from person import ANONYMOUS
+from utils import log_error, log_info
+
+# Readings above this sound the booth's alarm
+FEVER_TEMPERATURE = 38.0
+DEFAULT_WINDOW_MINS = 30
+
+EXPORT_FORMATS = {".parquet": "parquet", ".arrow": "arrow", ".feather": "arrow"}
+
+
+class TracingError(Exception):
+    def __init__(self, message: str):
+        self._message = message
+
+    def __str__(self):
+        return self._message
+
+
+# The closest check-in of another person to the traced person in the same room
+@dataclass
+class Exposure:
+    name: str
+    contact_number: str
+    room_id: str
+    time_detected: datetime
+    # How far apart the two check-ins were
+    gap: timedelta
+    n_encounters: int
+
+
+# Check-ins from one or more journals, kept column-wise with shared strings so months of
+# them fit in memory. Each room's check-in times are sorted, so finding who was there
+# around a time is a binary search
+class CheckInIndex:
+    def __init__(self):
+        self.names: List[str] = []
+        self.addresses: List[str] = []
+        self.contact_numbers: List[str] = []
+        self.room_ids: List[str] = []
+        self.temperatures: List[float] = []
+        self.times: List[datetime] = []
+
+        self._strings: Dict[str, str] = {}
+        # Per room, check-in times in order and the rows they belong to
+        self._by_room: Dict[str, Tuple[List[datetime], List[int]]] = {}
+        # Per contact number, rows in time order
+        self._by_contact_number: Dict[str, List[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.times)
+
+    @classmethod
+    def from_journals(cls, paths: Iterable[str]) -> "CheckInIndex":
+        index = cls()
+
+        for path in paths:
+            index.add_rows(read_check_ins(path))
+
+        index.build()
+        return index
+
+    def add_rows(self, rows: Iterable[tuple]) -> None:
+        # Adds journal rows; `build` must be called before querying
+        intern = self._intern
+
+        for _, name, address, contact_number, room_id, temperature, time in rows:
+            self.names.append(intern(name))
+            self.addresses.append(intern(address))
+            self.contact_numbers.append(intern(contact_number))
+            self.room_ids.append(intern(room_id))
+            self.temperatures.append(temperature)
+            self.times.append(datetime.fromisoformat(time))
+
+    def build(self) -> None:
+        rows_by_room: Dict[str, List[int]] = defaultdict(list)
+        rows_by_contact_number: Dict[str, List[int]] = defaultdict(list)
+
+        for row, (room_id, contact_number) in enumerate(
+            zip(self.room_ids, self.contact_numbers)
+        ):
+            rows_by_room[room_id].append(row)
+            rows_by_contact_number[contact_number].append(row)
+
+        times = self.times
+        # Journals are read in time order, so this is mostly merging already sorted runs
+        self._by_room = {}
+
+        for room_id, rows in rows_by_room.items():
+            rows.sort(key=times.__getitem__)
+            self._by_room[room_id] = ([times[row] for row in rows], rows)
+
+        for rows in rows_by_contact_number.values():
+            rows.sort(key=times.__getitem__)
+
+        self._by_contact_number = dict(rows_by_contact_number)
+
+    def find_contact_numbers(self, query: str) -> List[str]:
+        # Returns contact numbers matching `query` exactly or by name, ignoring case.
+        # Anonymous check-ins share a contact number but are not one person
+        if query == ANONYMOUS:
+            return []
+
+        if query in self._by_contact_number:
+            return [query]
+
+        query = query.casefold()
+        contact_numbers = {
+            self.contact_numbers[rows[0]]
+            for rows in self._by_contact_number.values()
+            if self.names[rows[0]].casefold() == query
+        }
+        contact_numbers.discard(ANONYMOUS)
+        return sorted(contact_numbers)
+
+    def timeline(self, contact_number: str) -> List[int]:
+        # Returns the rows of a person's check-ins in time order
+        return self._by_contact_number.get(contact_number, [])
+
+    def exposures(
+        self,
+        contact_number: str,
+        window: timedelta,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+    ) -> List[Exposure]:
+        # Returns everyone who checked into the same room within `window` of the person,
+        # closest first. Anonymous check-ins are each their own exposure
+        by_visitor: Dict[Union[str, int], Exposure] = {}
+        # Check-ins of each other visitor within the window of any of the person's,
+        # so one check-in near several of theirs counts once
+        encountered_rows: Dict[Union[str, int], Set[int]] = defaultdict(set)
+
+        for row in self.timeline(contact_number):
+            time = self.times[row]
+
+            if (since is not None and time < since) or (
+                until is not None and time >= until
+            ):
+                continue
+
+            room_id = self.room_ids[row]
+            room_times, room_rows = self._by_room[room_id]
+            start = bisect_left(room_times, time - window)
+            end = bisect_right(room_times, time + window)
+
+            for other in room_rows[start:end]:
+                other_contact_number = self.contact_numbers[other]
+
+                if other_contact_number == contact_number:
+                    continue
+
+                visitor: Union[str, int] = other_contact_number
+
+                if other_contact_number == ANONYMOUS:
+                    visitor = other
+
+                gap = abs(self.times[other] - time)
+                encountered_rows[visitor].add(other)
+                exposure = by_visitor.get(visitor)
+
+                if exposure is None:
+                    by_visitor[visitor] = Exposure(
+                        self.names[other],
+                        other_contact_number,
+                        room_id,
+                        self.times[other],
+                        gap,
+                        0,
+                    )
+                    continue
+
+                if gap < exposure.gap:
+                    exposure.room_id = room_id
+                    exposure.time_detected = self.times[other]
+                    exposure.gap = gap
+
+        for visitor, exposure in by_visitor.items():
+            exposure.n_encounters = len(encountered_rows[visitor])
+
+        return sorted(by_visitor.values(), key=lambda exposure: exposure.gap)
+
+    def fevers_by_room_and_day(
+        self, threshold: float = FEVER_TEMPERATURE
+    ) -> Dict[Tuple[str, date], List[int]]:
+        # Returns the rows of readings above `threshold`, grouped by room and day
+        fevers: Dict[Tuple[str, date], List[int]] = defaultdict(list)
+
+        for row, temperature in enumerate(self.temperatures):
+            if temperature > threshold:
+                fevers[(self.room_ids[row], self.times[row].date())].append(row)
+
+        return dict(sorted(fevers.items()))
+
+    def export(self, path: str) -> None:
+        # Writes every check-in to a Parquet or Arrow IPC file, chosen by extension
+        export_format = next(
+            (
+                export_format
+                for extension, export_format in EXPORT_FORMATS.items()
+                if path.lower().endswith(extension)
+            ),
+            None,
+        )
+
+        if export_format is None:
+            raise TracingError(
+                f"Unknown export format for `{path}`, expected one of "
+                f"{list(EXPORT_FORMATS)}"
+            )
+
+        try:
+            import pyarrow
+        except ImportError:
+            raise TracingError("Exporting requires pyarrow")
+
+        table = pyarrow.table(
+            {
+                "name": pyarrow.array(self.names).dictionary_encode(),
+                "address": pyarrow.array(self.addresses).dictionary_encode(),
+                "contact_number": pyarrow.array(self.contact_numbers),
+                "room_id": pyarrow.array(self.room_ids).dictionary_encode(),
+                "temperature": pyarrow.array(self.temperatures, pyarrow.float32()),
+                "time_detected": pyarrow.array(self.times, pyarrow.timestamp("us")),
+            }
+        )
+
+        if export_format == "parquet":
+            import pyarrow.parquet
+
+            pyarrow.parquet.write_table(table, path)
+        else:
+            import pyarrow.feather
+
+            pyarrow.feather.write_feather(table, path)
+
+    def _intern(self, string: str) -> str:
+        return self._strings.setdefault(string, string)
+
+
+def print_exposures(index: CheckInIndex, args: Namespace) -> int:
+    contact_numbers = index.find_contact_numbers(args.person)
+
+    if len(contact_numbers) == 0:
+        log_error(f"No check-ins found for `{args.person}`")
+        return 1
+
+    for contact_number in contact_numbers:
+        rows = index.timeline(contact_number)
+        print(
+            f"# {index.names[rows[0]]} ({contact_number}), {len(rows)} check-ins, "
+            f"within {args.window_mins} minutes:"
+        )
+
+        for exposure in index.exposures(
+            contact_number, timedelta(minutes=args.window_mins), args.since, args.until
+        ):
+            print(
+                f"{exposure.name}\t{exposure.contact_number}\t{exposure.room_id}\t"
+                f"{exposure.time_detected.isoformat(sep=' ', timespec='seconds')}\t"
+                f"{exposure.gap.total_seconds() / 60:.1f} min\t"
+                f"{exposure.n_encounters} encounters"
+            )
+
+    return 0
+
+
+def print_fevers(index: CheckInIndex, args: Namespace) -> int:
+    for (room_id, day), rows in index.fevers_by_room_and_day(args.threshold).items():
+        print(f"# Room {room_id} on {day.isoformat()}: {len(rows)} readings")
+
+        for row in rows:
+            print(
+                f"{index.names[row]}\t{index.contact_numbers[row]}\t"
+                f"{index.times[row].isoformat(sep=' ', timespec='seconds')}\t"
+                f"{index.temperatures[row]:.1f} C"
+            )
+
+    return 0
+
+
+def export(index: CheckInIndex, args: Namespace) -> int:
+    index.export(args.path)
+    log_info(f"Exported {len(index)} check-ins to `{args.path}`")
+    return 0
+
+
+def main(args: Namespace) -> int:
+    try:
+        index = CheckInIndex.from_journals(args.journals)
+    except Exception as error:
+        log_error(f"Failed to read journals: {error}")
+        return 1
+
+    log_info(f"Indexed {len(index)} check-ins from {len(args.journals)} journals")
+
+    try:
+        return args.command(index, args)
+    except TracingError as error:
+        log_error(str(error))
+        return 1
+
+
+def parse_args() -> Namespace:
+    parser = ArgumentParser(
+        description="Query check-ins logged by one or more booths for contact tracing"
+    )
+    parser.add_argument(
+        "-j",
+        "--journal",
+        dest="journals",
+        action="append",
+        required=True,
+        help="Journal of a booth; repeat to combine several booths",
+    )
+    subparsers = parser.add_subparsers(required=True)
+
+    exposures_parser = subparsers.add_parser(
+        "exposures", help="List who checked into the same room around a person"
+    )
+    exposures_parser.add_argument("person", help="Contact number or name")
+    exposures_parser.add_argument(
+        "-w",
+        "--window-mins",
+        type=float,
+        default=DEFAULT_WINDOW_MINS,
+        help="How far apart check-ins may be to count as an encounter",
+    )
+    exposures_parser.add_argument(
+        "--since",
+        type=datetime.fromisoformat,
+        help="Only trace the person's check-ins from this time",
+    )
+    exposures_parser.add_argument(
+        "--until",
+        type=datetime.fromisoformat,
+        help="Only trace the person's check-ins before this time",
+    )
+    exposures_parser.set_defaults(command=print_exposures)
+
+    fevers_parser = subparsers.add_parser(
+        "fevers", help="List abnormal temperature readings by room and day"
+    )
+    fevers_parser.add_argument(
+        "-t",
+        "--threshold",
+        type=float,
+        default=FEVER_TEMPERATURE,
+        help="Readings above this temperature count as abnormal",
+    )
+    fevers_parser.set_defaults(command=print_fevers)
+
+    export_parser = subparsers.add_parser(
+        "export", help="Write every check-in to a Parquet or Arrow file"
+    )
+    export_parser.add_argument("path", help="Output path ending in .parquet or .arrow")
+    export_parser.set_defaults(command=export)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
@@ -0,0 +1,162 @@
+import socket
+import time
+from threading import Event, Thread
+from typing import Any, Optional
+
+from gi.repository import GLib, GObject
+
+import backend
+from aggregator_client import AggregatorClient
+import metrics
+from journal import Journal
+from utils import log_info, log_warn
+
+DEFAULT_BATCH_SIZE = 20
+DEFAULT_BATCH_AGE_SECS = 5.0
+MAX_ROWS_PER_REQUEST = 500
+RETRY_INTERVAL_SECS = 30.0
+STOP_TIMEOUT_SECS = 10.0
+
+SYNC_CURSOR_NAME = "spreadsheet"
+
+
+class SpreadsheetUploader(GObject.Object):
+    __gsignals__ = {
+        "uploaded": (GObject.SIGNAL_RUN_LAST, None, (int,)),
+        "error": (GObject.SIGNAL_RUN_LAST, None, (str,)),
+    }
+
+    _thread: Optional[Thread] = None
+    _sink: Optional[Any] = None
+    _is_stopping = False
+
+    def __init__(
+        self,
+        spreadsheet_id: str,
+        journal: Journal,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        batch_age_secs: float = DEFAULT_BATCH_AGE_SECS,
+        aggregator_address: str = "",
+        booth_id: str = "",
+    ):
+        super().__init__()
+
+        self._spreadsheet_id = spreadsheet_id
+        self._journal = journal
+        self._batch_size = batch_size
+        self._batch_age_secs = batch_age_secs
+        self._aggregator_address = aggregator_address
+        self._booth_id = booth_id if booth_id != "" else socket.gethostname()
+        self._wake_event = Event()
+
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+
+        self._is_stopping = False
+        self._thread = Thread(
+            target=self._run, name="spreadsheet-uploader", daemon=True
+        )
+        self._thread.start()
+        log_info("Spreadsheet uploader started")
+
+    def stop(self) -> bool:
+        # Returns whether the worker exited, so the journal is safe to close
+        if self._thread is None:
+            return True
+
+        self._is_stopping = True
+        self._wake_event.set()
+        self._thread.join(STOP_TIMEOUT_SECS)
+
+        if self._thread.is_alive():
+            return False
+
+        self._thread = None
+        return True
+
+    def notify(self) -> None:
+        self._wake_event.set()
+
+    def _run(self) -> None:
+        self._warm_up()
+
+        # Replicate whatever was left unsent by a previous run right away
+        flush_at: Optional[float] = time.monotonic()
+        is_retrying = False
+
+        while True:
+            timeout = (
+                None if flush_at is None else max(0.0, flush_at - time.monotonic())
+            )
+            self._wake_event.wait(timeout)
+            self._wake_event.clear()
+
+            if self._is_stopping:
+                self._sync()
+                return
+
+            n_unsynced = self._journal.count_unsynced(SYNC_CURSOR_NAME)
+
+            if n_unsynced == 0:
+                flush_at = None
+                continue
+
+            if flush_at is None:
+                flush_at = time.monotonic() + self._batch_age_secs
+
+            if n_unsynced >= self._batch_size and not is_retrying:
+                flush_at = time.monotonic()
+
+            if time.monotonic() < flush_at:
+                continue
+
+            if self._sync():
+                flush_at = None
+                is_retrying = False
+            else:
+                flush_at = time.monotonic() + RETRY_INTERVAL_SECS
+                is_retrying = True
+
+    def _sync(self) -> bool:
+        while True:
+            rows = self._journal.get_unsynced(SYNC_CURSOR_NAME, MAX_ROWS_PER_REQUEST)
+
+            if len(rows) == 0:
+                return True
+
+            try:
+                if self._sink is None:
+                    self._sink = self._connect()
+
+                with metrics.time_stage("spreadsheet_upload"):
+                    self._sink.append_persons([person for _, person in rows])
+            except Exception as error:
+                # Force re-authorization on the next attempt in case the session expired
+                self._sink = None
+                GLib.idle_add(self._emit_on_main_loop, "error", str(error))
+                return False
+
+            last_id, _ = rows[-1]
+            self._journal.advance_cursor(SYNC_CURSOR_NAME, last_id)
+            metrics.increment("rows_uploaded", len(rows))
+            GLib.idle_add(self._emit_on_main_loop, "uploaded", len(rows))
+
+    def _warm_up(self) -> None:
+        # Authorize now rather than on the first check-in; failures are retried on sync
+        try:
+            with metrics.time_stage("spreadsheet_connect"):
+                self._sink = self._connect()
+        except Exception as error:
+            log_warn(f"Failed to connect to spreadsheet ahead of time: {error}")
+
+    def _connect(self) -> Any:
+        # Both provide append_persons, raising if the rows were not written
+        if self._aggregator_address != "":
+            return AggregatorClient(self._aggregator_address, self._booth_id)
+
+        return backend.create_spreadsheet(self._spreadsheet_id)
+
+    def _emit_on_main_loop(self, signal_name: str, *args: Any) -> bool:
+        self.emit(signal_name, *args)
+        return False
@@ -1,4 +1,13 @@
+import atexit
+import os
+import queue
 import sys
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime
+from threading import Lock, Thread
+from typing import Any, Deque, Dict, List, Optional, TextIO
 
 BOLD = "\033[1m"
 RED = "\033[31m"
@@ -6,14 +15,196 @@ YELLOW = "\033[33m"
 BLUE = "\033[34m"
 ENDC = "\033[0m"
 
+LEVEL_COLORS = {"INFO": BLUE, "WARN": YELLOW, "ERROR": RED}
 
-def log_info(text: str) -> None:
-    print(f"{BOLD}{BLUE}INFO{ENDC}: {text}")
+DEFAULT_QUEUE_SIZE = 4096
+DEFAULT_RING_SIZE = 500
+DEFAULT_FLUSH_INTERVAL_SECS = 1.0
+DEFAULT_MAX_BYTES = 1024 * 1024
+DEFAULT_BACKUP_COUNT = 3
+MAX_BATCH_SIZE = 256
 
 
-def log_warn(text: str) -> None:
-    print(f"{BOLD}{YELLOW}WARN{ENDC}: {text}", file=sys.stderr)
+@dataclass
+class LogRecord:
+    level: str
+    text: str
+    stage: str = ""
+    fields: Dict[str, Any] = field(default_factory=dict)
+    monotonic: float = field(default_factory=time.monotonic)
+    time: float = field(default_factory=time.time)
 
+    def format(self, colored: bool) -> str:
+        level = (
+            f"{BOLD}{LEVEL_COLORS[self.level]}{self.level}{ENDC}"
+            if colored
+            else self.level
+        )
+        stage = f"[{self.stage}] " if self.stage != "" else ""
+        fields = "".join(f" {key}={value!r}" for key, value in self.fields.items())
 
-def log_error(text: str) -> None:
-    print(f"{BOLD}{RED}ERROR{ENDC}: {text}", file=sys.stderr)
+        if colored:
+            return f"{level}: {stage}{self.text}{fields}"
+
+        timestamp = datetime.fromtimestamp(self.time).isoformat(timespec="milliseconds")
+        return f"{timestamp} {level}: {stage}{self.text}{fields}"
+
+
+# Hands records to a background writer so logging never blocks the caller. They go to
+# stdout/stderr until `configure` points them at a rotated file, and the most recent are
+# kept for crash reports
+class Logger:
+    _thread: Optional[Thread] = None
+    _file: Optional[TextIO] = None
+    _path = ""
+
+    def __init__(self):
+        self._queue: queue.Queue = queue.Queue(DEFAULT_QUEUE_SIZE)
+        self._ring: Deque[LogRecord] = deque(maxlen=DEFAULT_RING_SIZE)
+        # Guards the ring, the drop count and starting the writer thread
+        self._lock = Lock()
+        self._n_dropped = 0
+        self._flush_interval_secs = DEFAULT_FLUSH_INTERVAL_SECS
+        self._max_bytes = DEFAULT_MAX_BYTES
+        self._backup_count = DEFAULT_BACKUP_COUNT
+
+    def configure(
+        self,
+        path: str = "",
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        backup_count: int = DEFAULT_BACKUP_COUNT,
+        flush_interval_secs: float = DEFAULT_FLUSH_INTERVAL_SECS,
+        ring_size: int = DEFAULT_RING_SIZE,
+    ) -> None:
+        self.flush()
+
+        with self._lock:
+            self._ring = deque(self._ring, maxlen=ring_size)
+
+        self._path = path
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._flush_interval_secs = flush_interval_secs
+
+    def log(self, record: LogRecord) -> None:
+        with self._lock:
+            self._ring.append(record)
+
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name="logger", daemon=True)
+                self._thread.start()
+
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self._n_dropped += 1
+
+    def get_recent(self) -> List[LogRecord]:
+        with self._lock:
+            return list(self._ring)
+
+    def dump_recent(self, file: TextIO) -> None:
+        for record in self.get_recent():
+            file.write(record.format(colored=False) + "\n")
+
+        file.flush()
+
+    def flush(self) -> None:
+        if self._thread is not None:
+            self._queue.join()
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self._flush_interval_secs
+
+            while len(batch) < MAX_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+
+                if timeout <= 0:
+                    break
+
+                try:
+                    batch.append(self._queue.get(timeout=timeout))
+                except queue.Empty:
+                    break
+
+            try:
+                self._write(batch)
+            except Exception as error:
+                print(
+                    f"Failed to write {len(batch)} log records: {error}",
+                    file=sys.stderr,
+                )
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, batch: List[LogRecord]) -> None:
+        with self._lock:
+            n_dropped = self._n_dropped
+            self._n_dropped = 0
+
+        if n_dropped > 0:
+            batch.append(
+                LogRecord("WARN", f"Dropped {n_dropped} log records: queue full")
+            )
+
+        if self._path == "":
+            self._close_file()
+
+            for record in batch:
+                stream = sys.stdout if record.level == "INFO" else sys.stderr
+                stream.write(record.format(colored=True) + "\n")
+
+            sys.stdout.flush()
+            sys.stderr.flush()
+            return
+
+        if self._file is None or self._file.name != self._path:
+            self._close_file()
+            self._file = open(self._path, "a")
+
+        self._file.write(
+            "".join(record.format(colored=False) + "\n" for record in batch)
+        )
+        self._file.flush()
+
+        if self._file.tell() >= self._max_bytes:
+            self._rotate()
+
+    def _rotate(self) -> None:
+        self._close_file()
+
+        for index in range(self._backup_count - 1, 0, -1):
+            source = f"{self._path}.{index}"
+
+            if os.path.exists(source):
+                os.replace(source, f"{self._path}.{index + 1}")
+
+        if self._backup_count > 0:
+            os.replace(self._path, f"{self._path}.1")
+        else:
+            os.remove(self._path)
+
+    def _close_file(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+logger = Logger()
+atexit.register(logger.flush)
+
+
+def log_info(text: str, stage: str = "", **fields: Any) -> None:
+    logger.log(LogRecord("INFO", text, stage, fields))
+
+
+def log_warn(text: str, stage: str = "", **fields: Any) -> None:
+    logger.log(LogRecord("WARN", text, stage, fields))
+
+
+def log_error(text: str, stage: str = "", **fields: Any) -> None:
+    logger.log(LogRecord("ERROR", text, stage, fields))
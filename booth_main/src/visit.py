@@ -0,0 +1,39 @@
+from dataclasses import dataclass
+from enum import Enum, auto
+from typing import Dict, Optional, Set
+
+from roster import RosterEntry
+
+
+class VisitState(Enum):
+    WAITING_FOR_HAND = auto()
+    MEASURING = auto()
+    DONE = auto()
+
+
+_TRANSITIONS: Dict[VisitState, Set[VisitState]] = {
+    VisitState.WAITING_FOR_HAND: {VisitState.MEASURING, VisitState.DONE},
+    VisitState.MEASURING: {VisitState.DONE},
+    VisitState.DONE: set(),
+}
+
+
+@dataclass
+class Visit:
+    # None when a hand was detected without a scanned code
+    code: Optional[str]
+    detected_at: float
+    state: VisitState = VisitState.WAITING_FOR_HAND
+    timeout_id: Optional[int] = None
+    # Set when the code was found on the roster, which then takes precedence
+    roster_entry: Optional[RosterEntry] = None
+
+    def transition(self, state: VisitState) -> bool:
+        # Returns False if `state` cannot be reached from the current one, which is how
+        # late callbacks, like a reading arriving after its timeout, find out they are
+        # stale
+        if state not in _TRANSITIONS[self.state]:
+            return False
+
+        self.state = state
+        return True
@@ -1,18 +1,88 @@
-import csv
 import errno
+import hashlib
+import json
 import os
 import sys
+import time
+import zipfile
+import zlib
 from argparse import Namespace
+from dataclasses import dataclass
+from io import BytesIO
+from itertools import islice
+from multiprocessing import Pool
 from pathlib import Path
-from typing import List
+from typing import (
+    Any,
+    BinaryIO,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Tuple,
+    TypeVar,
+)
 
 import qrcode
+import qrcode.constants
+import qrcode.util
 import pandas
-
-BOLD = "\033[1m"
-RED = "\033[31m"
-BLUE = "\033[34m"
-ENDC = "\033[0m"
+from PIL import Image, ImageDraw, ImageFont
+
+# The payload format and logger are defined once, next to the booth code. Appended so
+# that nothing already importable resolves to the booth's modules instead
+sys.path.append(str(Path(__file__).resolve().parent.parent / "booth_main" / "src"))
+
+from payload import (
+    CONTACT_NUMBER_PUNCTUATION,
+    ID_PAYLOAD_PREFIX,
+    PAYLOAD_ESCAPE,
+    PAYLOAD_SEPARATOR,
+    PAYLOAD_VERSION,
+    roster_id,
+)
+from utils import log_error, log_info, logger
+
+ID_COLUMN = "id"
+
+# Rows handed to a worker process at a time
+JOB_CHUNK_SIZE = 16
+
+# Anything that changes the rendered image must be in here so the manifest
+# notices when it changes
+QR_RENDER_OPTIONS = {
+    "version": 1,
+    "box_size": 10,
+    "border": 5,
+    "fill": "black",
+    "back_color": "white",
+}
+
+MANIFEST_FILE_NAME = ".manifest.json"
+MANIFEST_VERSION = 1
+
+# Printable sheets: A4 at 150 DPI, in pixels
+SHEET_DPI = 150
+SHEET_SIZE = (1240, 1754)
+SHEET_MARGIN = 60
+SHEET_COLUMNS = 3
+SHEET_ROWS = 4
+LABEL_HEIGHT = 70
+LABEL_FONT_SIZE = 24
+
+# Rows whose payload does not fit this QR version are rejected; larger versions
+# have smaller modules and take longer to decode at the booth
+DEFAULT_MAX_QR_VERSION = 10
+QR_ERROR_CORRECTION = qrcode.constants.ERROR_CORRECT_M
+
+CONTACT_NUMBER_PATTERN = r"^\+?\d{7,15}$"
+FILE_NAME_FORBIDDEN = r"[^\w\-. ]"
+FILE_NAME_MAX_LENGTH = 96
+MAX_REPORTED_ERRORS = 20
+
+T = TypeVar("T")
+R = TypeVar("R")
 
 
 class InvalidHeader(Exception):
@@ -30,17 +100,16 @@ class InvalidHeader(Exception):
         )
 
 
-def log_error(text: str) -> None:
-    print(f"{BOLD}{RED}ERROR{ENDC}: {text}")
-
-
-def log_info(text: str) -> None:
-    print(f"{BOLD}{BLUE}INFO{ENDC}: {text}")
-
-
 # From https://stackoverflow.com/a/34325723 CC BY-SA 4.0
 def progressBar(
-    iterable, prefix="", suffix="", decimals=1, length=100, fill="█", printEnd="\r"
+    iterable,
+    prefix="",
+    suffix="",
+    decimals=1,
+    length=100,
+    fill="█",
+    printEnd="\r",
+    total=None,
 ):
     """
     Call in a loop to create terminal progress bar
@@ -52,8 +121,10 @@ def progressBar(
         length      - Optional  : character length of bar (Int)
         fill        - Optional  : bar fill character (Str)
         printEnd    - Optional  : end character (e.g. "\r", "\r\n") (Str)
+        total       - Optional  : item count when iterable has no len() (Int)
     """
-    total = len(iterable)
+    if total is None:
+        total = len(iterable)
 
     def printProgressBar(iteration):
         percent = ("{0:." + str(decimals) + "f}").format(
@@ -70,18 +141,430 @@ def progressBar(
     print()
 
 
-def excel_file_to_csv(excel_file_path: Path) -> str:
-    df = pandas.read_excel(excel_file_path)
-    return df.to_csv(None, index=None, header=True)
+@dataclass
+class ValidationReport:
+    n_rows: int
+    n_blank: int
+    n_duplicates: int
+    n_renamed: int
+    # Indexed by Excel row number, holding the reason the row was skipped
+    rejected: "pandas.Series[str]"
+    duration_secs: float
+
+    def log(self) -> None:
+        n_valid = self.n_rows - self.n_blank - self.n_duplicates - len(self.rejected)
+        log_info(
+            f"Validated {self.n_rows} rows in {self.duration_secs * 1000:.1f} ms: "
+            f"{n_valid} valid, {len(self.rejected)} rejected, {self.n_blank} blank, "
+            f"{self.n_duplicates} duplicates dropped, {self.n_renamed} file names "
+            "disambiguated"
+        )
 
+        for row, reason in self.rejected.head(MAX_REPORTED_ERRORS).items():
+            log_error(f"Row {row}: {reason}")
 
-def create_and_save_qr_code(data: str, path: Path) -> None:
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+        if len(self.rejected) > MAX_REPORTED_ERRORS:
+            log_error(f"... and {len(self.rejected) - MAX_REPORTED_ERRORS} more")
+
+
+def qr_byte_capacity(version: int) -> int:
+    bits = qrcode.util.BIT_LIMIT_TABLE[QR_ERROR_CORRECTION][version]
+    overhead = 4 + qrcode.util.length_in_bits(qrcode.util.MODE_8BIT_BYTE, version)
+    return (bits - overhead) // 8
+
+
+def normalize_text(column: pandas.Series) -> pandas.Series:
+    return (
+        column.astype("string")
+        .fillna("")
+        .str.strip()
+        .str.replace(r"\s+", " ", regex=True)
+    )
+
+
+def normalize_number(column: pandas.Series) -> pandas.Series:
+    # Excel hands numbers over as floats, which would stringify as `9191999999.0` or
+    # `9.19e9`; text cells are kept as typed so leading zeros survive
+    is_text = column.map(type) == str
+    numbers = pandas.to_numeric(column.mask(is_text), errors="coerce")
+    is_integral = numbers.notna() & (numbers % 1 == 0)
+    integers = numbers.where(is_integral).astype("Int64").astype("string")
+    text = normalize_text(column.where(is_text))
+    return text.mask(is_integral, integers).fillna("")
+
+
+def escape_payload_field(column: pandas.Series) -> pandas.Series:
+    return column.str.replace(
+        PAYLOAD_ESCAPE, PAYLOAD_ESCAPE * 2, regex=False
+    ).str.replace(PAYLOAD_SEPARATOR, PAYLOAD_ESCAPE + PAYLOAD_SEPARATOR, regex=False)
+
+
+def build_payloads(roster: pandas.DataFrame, payload_format: str) -> pandas.Series:
+    # Column-wise counterpart of the `encode_*` functions
+    if payload_format == "id":
+        return ID_PAYLOAD_PREFIX + roster["id"]
+
+    if payload_format == "yaml":
+        payload = pandas.Series("", index=roster.index, dtype="string")
+
+        for column in ("name", "address", "contact_number", "room_id"):
+            payload = payload + f"\n{column}: " + roster[column]
+
+        return payload + "\n"
+
+    payload = pandas.Series(PAYLOAD_VERSION, index=roster.index, dtype="string")
+
+    for column in ("name", "address", "contact_number", "room_id"):
+        payload = payload + PAYLOAD_SEPARATOR + escape_payload_field(roster[column])
+
+    return payload
+
+
+def validate_roster(
+    df: pandas.DataFrame, payload_format: str, max_qr_version: int
+) -> Tuple[pandas.DataFrame, ValidationReport]:
+    # Normalizes the Excel rows and drops those that would make unusable codes. Every
+    # check works on whole columns, so this stays fast on large rosters
+    started_at = time.monotonic()
+
+    roster = pandas.DataFrame(
+        {
+            "name": normalize_text(df.iloc[:, 0]),
+            "address": normalize_text(df.iloc[:, 1]),
+            "contact_number": normalize_number(df.iloc[:, 2]).str.replace(
+                CONTACT_NUMBER_PUNCTUATION, "", regex=True
+            ),
+            "room_id": normalize_text(df.iloc[:, 3]),
+            # As typed, for reporting; non-integral floats normalize to nothing
+            "contact_number_cell": normalize_text(df.iloc[:, 2]),
+        }
+    )
+    # Excel row numbers, counting the header
+    roster.index = df.index + 2
+
+    columns = [str(column).strip().lower() for column in df.columns]
+
+    if ID_COLUMN in columns:
+        roster["id"] = normalize_number(df.iloc[:, columns.index(ID_COLUMN)]).values
+    else:
+        roster["id"] = ""
+
+    is_blank = (roster[["name", "address", "contact_number", "room_id"]] == "").all(
+        axis=1
+    )
+    roster = roster[~is_blank]
+
+    # Like before, a later row replaces an earlier one for the same person
+    is_duplicate = roster.duplicated(["name", "contact_number"], keep="last")
+    roster = roster[~is_duplicate].copy()
+
+    needs_id = roster["id"] == ""
+
+    if payload_format != "id":
+        # Only ID-only payloads use them, and hashing is per row
+        needs_id[:] = False
+
+    roster.loc[needs_id, "id"] = [
+        roster_id(name, contact_number)
+        for name, contact_number in zip(
+            roster.loc[needs_id, "name"], roster.loc[needs_id, "contact_number"]
+        )
+    ]
+
+    roster["payload"] = build_payloads(roster, payload_format)
+    payload_size = roster["payload"].str.encode("utf-8").str.len()
+    capacity = qr_byte_capacity(max_qr_version)
+    too_long = f" bytes does not fit QR version {max_qr_version} ({capacity} bytes)"
+
+    reason = pandas.Series("", index=roster.index, dtype="string")
+    checks = [
+        (roster["name"] == "", "missing name"),
+        (
+            ~roster["contact_number"].str.fullmatch(CONTACT_NUMBER_PATTERN),
+            "invalid contact number `" + roster["contact_number_cell"] + "`",
+        ),
+        (roster["room_id"] == "", "missing room ID"),
+        (
+            payload_size > capacity,
+            "payload of " + payload_size.astype("string") + too_long,
+        ),
+    ]
+
+    # The first failing check is the one reported
+    for failed, message in checks:
+        reason = reason.mask(failed & (reason == ""), message)
+
+    is_rejected = reason != ""
+    rejected = reason[is_rejected]
+    roster = roster[~is_rejected].drop(columns="contact_number_cell")
+
+    file_stem = (
+        (roster["name"] + "_" + roster["contact_number"])
+        .str.replace(FILE_NAME_FORBIDDEN, "_", regex=True)
+        .str.slice(0, FILE_NAME_MAX_LENGTH)
+    )
+    # Different people can still share a name after sanitizing and truncating
+    n_seen = file_stem.groupby(file_stem).cumcount()
+    is_renamed = n_seen > 0
+    file_stem = file_stem.mask(is_renamed, file_stem + "_" + n_seen.astype("string"))
+
+    roster["file_name"] = file_stem + ".png"
+    roster["label"] = roster["name"] + "\n" + roster["room_id"]
+
+    report = ValidationReport(
+        len(df),
+        int(is_blank.sum()),
+        int(is_duplicate.sum()),
+        int(is_renamed.sum()),
+        rejected,
+        time.monotonic() - started_at,
+    )
+
+    return roster, report
+
+
+def encode_legacy_payload(
+    name: str, address: str, contact_number: str, room_id: str
+) -> str:
+    return f"""
+name: {name}
+address: {address}
+contact_number: {contact_number}
+room_id: {room_id}
+"""
+
+
+def make_qr_image(data: str, image_factory: Any = None) -> Any:
+    qr = qrcode.QRCode(
+        version=QR_RENDER_OPTIONS["version"],
+        box_size=QR_RENDER_OPTIONS["box_size"],
+        border=QR_RENDER_OPTIONS["border"],
+    )
     qr.add_data(data)
     qr.make(fit=True)
 
-    image = qr.make_image(fill="black", back_color="white")
-    image.save(path)
+    if image_factory is not None:
+        return qr.make_image(image_factory=image_factory)
+
+    return qr.make_image(
+        fill=QR_RENDER_OPTIONS["fill"], back_color=QR_RENDER_OPTIONS["back_color"]
+    )
+
+
+def create_and_save_qr_code(data: str, path: Path) -> None:
+    make_qr_image(data).save(path)
+
+
+def render_qr_code(task: Tuple[str, Path]) -> str:
+    data, path = task
+    create_and_save_qr_code(data, path)
+    return path.name
+
+
+def render_qr_png(task: Tuple[str, str, str]) -> Tuple[str, str, bytes]:
+    data, file_name, label = task
+    buffer = BytesIO()
+    make_qr_image(data).save(buffer, "PNG")
+    return file_name, label, buffer.getvalue()
+
+
+def iter_sheets(codes: Iterable[Tuple[str, str, bytes]]) -> Iterator[Image.Image]:
+    # Tiles codes with their labels onto pages, holding only the current page
+    cell_width = (SHEET_SIZE[0] - 2 * SHEET_MARGIN) // SHEET_COLUMNS
+    cell_height = (SHEET_SIZE[1] - 2 * SHEET_MARGIN) // SHEET_ROWS
+    code_size = min(cell_width, cell_height - LABEL_HEIGHT)
+    font = ImageFont.load_default(LABEL_FONT_SIZE)
+
+    codes_iter = iter(codes)
+
+    while True:
+        page = list(islice(codes_iter, SHEET_COLUMNS * SHEET_ROWS))
+
+        if len(page) == 0:
+            return
+
+        sheet = Image.new("L", SHEET_SIZE, 255)
+        draw = ImageDraw.Draw(sheet)
+
+        for slot, (_, label, png) in enumerate(page):
+            left = SHEET_MARGIN + (slot % SHEET_COLUMNS) * cell_width
+            top = SHEET_MARGIN + (slot // SHEET_COLUMNS) * cell_height
+
+            with Image.open(BytesIO(png)) as image:
+                code = image.convert("L").resize(
+                    (code_size, code_size), Image.Resampling.NEAREST
+                )
+
+            sheet.paste(code, (left + (cell_width - code_size) // 2, top))
+            draw.multiline_text(
+                (left + cell_width // 2, top + code_size),
+                label,
+                fill=0,
+                font=font,
+                anchor="ma",
+                align="center",
+            )
+
+        yield sheet
+
+
+# Writes grayscale pages to a PDF one at a time. Pillow's PDF writer needs every page up
+# front, which for thousands of codes does not fit in memory
+class PdfWriter:
+    def __init__(self, file: BinaryIO, dpi: int):
+        self._file = file
+        self._dpi = dpi
+        # Objects 1 and 2 are the catalog and page tree, written last
+        self._offsets: Dict[int, int] = {}
+        self._page_ids: List[int] = []
+        self._next_id = 3
+
+        self._file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+
+    def add_page(self, image: Image.Image) -> None:
+        width, height = image.size
+        page_width = width * 72 / self._dpi
+        page_height = height * 72 / self._dpi
+
+        image_id = self._write_object(
+            f"<< /Type /XObject /Subtype /Image /Width {width} /Height {height} "
+            "/ColorSpace /DeviceGray /BitsPerComponent 8 /Filter /FlateDecode",
+            zlib.compress(image.convert("L").tobytes()),
+        )
+        contents_id = self._write_object(
+            "<<",
+            f"q {page_width:.2f} 0 0 {page_height:.2f} 0 0 cm /Code Do Q".encode(),
+        )
+        self._page_ids.append(
+            self._write_object(
+                f"<< /Type /Page /Parent 2 0 R "
+                f"/MediaBox [0 0 {page_width:.2f} {page_height:.2f}] "
+                f"/Resources << /XObject << /Code {image_id} 0 R >> >> "
+                f"/Contents {contents_id} 0 R >>"
+            )
+        )
+
+    def close(self) -> None:
+        kids = " ".join(f"{page_id} 0 R" for page_id in self._page_ids)
+        self._write_object("<< /Type /Catalog /Pages 2 0 R >>", id=1)
+        self._write_object(
+            f"<< /Type /Pages /Kids [{kids}] /Count {len(self._page_ids)} >>", id=2
+        )
+
+        xref_offset = self._file.tell()
+        n_objects = self._next_id
+        self._file.write(f"xref\n0 {n_objects}\n0000000000 65535 f \n".encode())
+
+        for id in range(1, n_objects):
+            self._file.write(f"{self._offsets[id]:010} 00000 n \n".encode())
+
+        self._file.write(
+            f"trailer\n<< /Size {n_objects} /Root 1 0 R >>\n"
+            f"startxref\n{xref_offset}\n%%EOF\n".encode()
+        )
+
+    def _write_object(self, dictionary: str, stream: bytes = b"", id: int = 0) -> int:
+        # A stream's dictionary is left open for its length to be appended
+        if id == 0:
+            id = self._next_id
+            self._next_id += 1
+
+        self._offsets[id] = self._file.tell()
+        self._file.write(f"{id} 0 obj\n{dictionary}".encode())
+
+        if len(stream) > 0:
+            self._file.write(f" /Length {len(stream)} >>\nstream\n".encode())
+            self._file.write(stream)
+            self._file.write(b"\nendstream")
+
+        self._file.write(b"\nendobj\n")
+        return id
+
+
+def write_zip(path: Path, codes: Iterable[Tuple[str, str, bytes]]) -> None:
+    # PNG is already compressed, so storing is as small and much faster
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED) as archive:
+        for file_name, _, png in codes:
+            archive.writestr(file_name, png)
+
+
+def write_pdf(path: Path, codes: Iterable[Tuple[str, str, bytes]]) -> None:
+    with open(path, "wb") as file:
+        writer = PdfWriter(file, SHEET_DPI)
+
+        for sheet in iter_sheets(codes):
+            writer.add_page(sheet)
+
+        writer.close()
+
+
+def write_sheets(folder: Path, codes: Iterable[Tuple[str, str, bytes]]) -> None:
+    for index, sheet in enumerate(iter_sheets(codes), 1):
+        sheet.save(folder / f"sheet_{index:04}.png", dpi=(SHEET_DPI, SHEET_DPI))
+
+
+def content_hash(data: str) -> str:
+    hasher = hashlib.sha256()
+    hasher.update(json.dumps(QR_RENDER_OPTIONS, sort_keys=True).encode())
+    hasher.update(data.encode())
+    return hasher.hexdigest()
+
+
+def load_manifest(output_folder: Path) -> Dict[str, str]:
+    try:
+        with open(output_folder / MANIFEST_FILE_NAME) as file:
+            data = json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+    if not isinstance(data, dict) or data.get("version") != MANIFEST_VERSION:
+        return {}
+
+    return data.get("entries", {})
+
+
+def save_manifest(output_folder: Path, entries: Dict[str, str]) -> None:
+    path = output_folder / MANIFEST_FILE_NAME
+    temp_path = path.with_name(path.name + ".tmp")
+
+    with open(temp_path, "w") as file:
+        json.dump({"version": MANIFEST_VERSION, "entries": entries}, file, indent=1)
+
+    os.replace(temp_path, path)
+
+
+def render_all(
+    render: Callable[[T], R],
+    tasks: Iterable[T],
+    n_tasks: int,
+    n_jobs: int,
+    ordered: bool = False,
+) -> Iterator[R]:
+    # The progress bar is printed directly, so pending log lines go out first
+    if n_jobs == 1:
+        logger.flush()
+        yield from progressBar(
+            map(render, tasks),
+            prefix="Encoding progress:",
+            suffix="Complete",
+            length=50,
+            total=n_tasks,
+        )
+        return
+
+    log_info(f"Encoding with {n_jobs} processes")
+    logger.flush()
+
+    with Pool(n_jobs) as pool:
+        imap = pool.imap if ordered else pool.imap_unordered
+
+        yield from progressBar(
+            imap(render, tasks, chunksize=JOB_CHUNK_SIZE),
+            prefix="Encoding progress:",
+            suffix="Complete",
+            length=50,
+            total=n_tasks,
+        )
 
 
 def valididate_header(header: List[str], column_no: int, column_name: str) -> None:
@@ -95,18 +578,35 @@ def valididate_header(header: List[str], column_no: int, column_name: str) -> No
 def main(args: Namespace) -> int:
     log_info(f"Excel File Path found is `{args.excel_file_path.resolve()}`")
 
-    csv_content = excel_file_to_csv(args.excel_file_path)
-    csv_data = csv.reader(csv_content.splitlines(), delimiter=",")
-
-    csv_data_iterator = iter(csv_data)
-    header = next(csv_data_iterator)
+    df = pandas.read_excel(args.excel_file_path)
+    header = [str(column) for column in df.columns]
 
     valididate_header(header, 0, "name")
     valididate_header(header, 1, "address")
     valididate_header(header, 2, "contact number")
     valididate_header(header, 3, "room id")
 
-    csv_data_no_header = list(csv_data_iterator)
+    roster, report = validate_roster(df, args.payload, args.max_qr_version)
+    report.log()
+
+    if args.report is not None:
+        report.rejected.rename("reason").to_csv(args.report, index_label="row")
+        log_info(f"Wrote rejected rows to `{args.report.resolve()}`")
+
+    if args.strict and len(report.rejected) > 0:
+        log_error("Not generating QR codes as some rows were rejected")
+        return 1
+
+    n_jobs = args.jobs
+    codes: Dict[str, Tuple[str, str]] = {
+        file_name: (payload, label)
+        for file_name, payload, label in zip(
+            roster["file_name"], roster["payload"], roster["label"]
+        )
+    }
+
+    if args.output_format in ("zip", "pdf"):
+        return export_to_file(args.output_format, args.output_folder, codes, n_jobs)
 
     try:
         os.makedirs(args.output_folder)
@@ -114,29 +614,104 @@ def main(args: Namespace) -> int:
         if error.errno != errno.EEXIST:
             raise
 
-    for row in progressBar(
-        csv_data_no_header, prefix="Encoding progress:", suffix="Complete", length=50
-    ):
-        name = row[0]
-        address = row[1]
-        contact_number = row[2]
-        room_id = row[3]
+    if args.output_format == "sheets":
+        write_sheets(args.output_folder, render_codes(codes, n_jobs))
+        log_info(f"Done. Saved QR code sheets at path {args.output_folder.resolve()}")
+        return 0
+
+    # Loaded even with --force so stale images stay tracked for --prune
+    old_manifest = load_manifest(args.output_folder)
+    new_manifest = {
+        file_name: content_hash(data) for file_name, (data, _) in codes.items()
+    }
+
+    def is_outdated(file_name: str) -> bool:
+        if args.force or old_manifest.get(file_name) != new_manifest[file_name]:
+            return True
+
+        return not (args.output_folder / file_name).exists()
+
+    n_tasks = sum(1 for file_name in new_manifest if is_outdated(file_name))
+    # Generated as the workers ask for them rather than all up front
+    tasks = (
+        (data, args.output_folder / file_name)
+        for file_name, (data, _) in codes.items()
+        if is_outdated(file_name)
+    )
 
-        qr_content = f"""
-name: {name}
-address: {address}
-contact_number: {contact_number}
-room_id: {room_id}
-"""
-        create_and_save_qr_code(
-            qr_content, args.output_folder / f"{name}_{contact_number}.png"
-        )
+    log_info(f"{n_tasks} of {len(new_manifest)} QR codes are new or changed")
+
+    # Only record what is on disk so an interrupted run resumes where it stopped
+    done_manifest = {
+        file_name: digest
+        for file_name, digest in old_manifest.items()
+        if new_manifest.get(file_name) == digest
+    }
+    stale_file_names = [
+        file_name for file_name in old_manifest if file_name not in new_manifest
+    ]
+
+    if args.prune:
+        for file_name in stale_file_names:
+            (args.output_folder / file_name).unlink(missing_ok=True)
+
+        log_info(f"Pruned {len(stale_file_names)} stale QR codes")
+    else:
+        # Keep tracking stale images so a later --prune can still find them
+        for file_name in stale_file_names:
+            done_manifest[file_name] = old_manifest[file_name]
+
+    try:
+        if n_tasks > 0:
+            for file_name in render_all(render_qr_code, tasks, n_tasks, n_jobs):
+                done_manifest[file_name] = new_manifest[file_name]
+    finally:
+        save_manifest(args.output_folder, done_manifest)
 
     log_info(f"Done. Saved QR codes at path {args.output_folder.resolve()}")
 
     return 0
 
 
+def render_codes(
+    codes: Dict[str, Tuple[str, str]], n_jobs: int
+) -> Iterator[Tuple[str, str, bytes]]:
+    # In row order, for printing
+    tasks = ((data, file_name, label) for file_name, (data, label) in codes.items())
+    return render_all(render_qr_png, tasks, len(codes), n_jobs, ordered=True)
+
+
+def export_to_file(
+    output_format: str, path: Path, codes: Dict[str, Tuple[str, str]], n_jobs: int
+) -> int:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Written next to the destination so an interrupted run leaves no partial file
+    temp_path = path.with_name(path.name + ".tmp")
+    write = write_zip if output_format == "zip" else write_pdf
+
+    try:
+        write(temp_path, render_codes(codes, n_jobs))
+    except BaseException:
+        temp_path.unlink(missing_ok=True)
+        raise
+
+    os.replace(temp_path, path)
+    log_info(f"Done. Saved {len(codes)} QR codes to {path.resolve()}")
+
+    return 0
+
+
+def job_count(value: str) -> int:
+    from argparse import ArgumentTypeError
+
+    n_jobs = int(value)
+
+    if n_jobs < 1:
+        raise ArgumentTypeError(f"must be at least 1, got {n_jobs}")
+
+    return n_jobs
+
+
 def parse_args() -> Namespace:
     from argparse import ArgumentParser
 
@@ -147,11 +722,60 @@ def parse_args() -> Namespace:
     parser.add_argument(
         "-v", "--verbose", action="store_true", help="Use verbose output"
     )
+    parser.add_argument(
+        "--payload",
+        choices=["compact", "id", "yaml"],
+        default="compact",
+        help="QR payload format; `id` needs booths to have the Excel file as their roster "
+        "and `yaml` is only for booths that predate the compact one",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=job_count,
+        default=1,
+        help="Number of processes rendering QR codes",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Render every QR code even if the output folder is up to date",
+    )
+    parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Delete QR codes of rows that are no longer in the Excel file",
+    )
+    parser.add_argument(
+        "--output-format",
+        choices=["folder", "zip", "pdf", "sheets"],
+        default="folder",
+        help="Write one PNG per row, a single ZIP of them, a printable PDF with labels, "
+        "or the same labelled pages as PNG sheets",
+    )
+    parser.add_argument(
+        "--max-qr-version",
+        type=int,
+        choices=range(1, 41),
+        default=DEFAULT_MAX_QR_VERSION,
+        metavar="1-40",
+        help="Reject rows whose payload does not fit this QR version",
+    )
+    parser.add_argument(
+        "--report",
+        type=Path,
+        help="Write the rejected rows and why to this CSV file",
+    )
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Do not generate anything if a row is rejected",
+    )
     parser.add_argument("excel_file_path", type=Path, help="Path to the Excel file")
     parser.add_argument(
         "output_folder",
         type=Path,
-        help="Directory where to store the output QR codes",
+        help="Directory where to store the output QR codes, or the file for zip and pdf",
     )
     return parser.parse_args()
 
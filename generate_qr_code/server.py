@@ -0,0 +1,422 @@
+import json
+import re
+import sys
+import zipfile
+from argparse import Namespace
+from collections import OrderedDict
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from qrcode.image.svg import SvgPathImage
+
+# Like in main, for the payload format and logger shared with the booth
+sys.path.append(str(Path(__file__).resolve().parent.parent / "booth_main" / "src"))
+
+from payload import (
+    encode_id_payload,
+    encode_payload,
+    normalize_contact_number,
+    normalize_text,
+    roster_id,
+)
+from utils import log_error, log_info
+from main import (
+    DEFAULT_MAX_QR_VERSION,
+    FILE_NAME_FORBIDDEN,
+    FILE_NAME_MAX_LENGTH,
+    content_hash,
+    encode_legacy_payload,
+    make_qr_image,
+    qr_byte_capacity,
+)
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8800
+DEFAULT_CACHE_SIZE = 512
+DEFAULT_DISK_CACHE_SIZE = 20_000
+DEFAULT_CACHE_DIR = Path(".qr_cache")
+WEB_ROOT = Path(__file__).resolve().parent.parent / "generate_qr_code_web"
+
+MAX_BATCH_SIZE = 2000
+MAX_BODY_SIZE = 4 * 1024 * 1024
+# Same limit the generator rejects rows at by default
+MAX_PAYLOAD_SIZE = qr_byte_capacity(DEFAULT_MAX_QR_VERSION)
+
+CONTENT_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+PAYLOAD_FORMATS = ["compact", "id", "yaml"]
+# Rendered codes never change for the same URL, as the URL is the payload
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class RequestError(Exception):
+    def __init__(self, message: str):
+        self._message = message
+
+    def __str__(self):
+        return self._message
+
+
+# Rendered codes keyed by a hash of their payload, render options and format. Recently
+# used ones are kept in memory and more on disk, so a restart does not render them again
+class RenderCache:
+    def __init__(
+        self,
+        max_size: int,
+        directory: Optional[Path],
+        max_disk_size: int = DEFAULT_DISK_CACHE_SIZE,
+    ):
+        self._max_size = max_size
+        self._directory = directory
+        self._max_disk_size = max_disk_size
+        self._lock = Lock()
+        # Both ordered from least to most recently used
+        self._entries: "OrderedDict[str, bytes]" = OrderedDict()
+        self._disk_keys: "OrderedDict[str, None]" = OrderedDict()
+        self.n_hits = 0
+        self.n_disk_hits = 0
+        self.n_misses = 0
+
+        if self._directory is not None:
+            self._directory.mkdir(parents=True, exist_ok=True)
+            # Hits touch their file, so modification time orders them across restarts
+            paths = sorted(
+                (path for path in self._directory.iterdir() if path.suffix != ".tmp"),
+                key=lambda path: path.stat().st_mtime,
+            )
+            self._disk_keys = OrderedDict((path.name, None) for path in paths)
+            self._evict_from_disk(self._directory)
+
+    def get(self, data: str, image_format: str) -> Tuple[str, bytes]:
+        # Returns the cache key, usable as an ETag, and the rendered code
+        key = f"{content_hash(data)}.{image_format}"
+
+        with self._lock:
+            image = self._entries.get(key)
+
+            if image is not None:
+                self._entries.move_to_end(key)
+                self.n_hits += 1
+                return key, image
+
+        # Rendered outside the lock; at worst two threads render the same code
+        image = self._read_from_disk(key)
+        is_from_disk = image is not None
+
+        if image is None:
+            image = render(data, image_format)
+            self._write_to_disk(key, image)
+
+        with self._lock:
+            if is_from_disk:
+                self.n_disk_hits += 1
+            else:
+                self.n_misses += 1
+
+            if self._directory is not None:
+                self._disk_keys[key] = None
+                self._disk_keys.move_to_end(key)
+                self._evict_from_disk(self._directory)
+
+            self._entries[key] = image
+            self._entries.move_to_end(key)
+
+            if len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+        return key, image
+
+    def _read_from_disk(self, key: str) -> Optional[bytes]:
+        if self._directory is None:
+            return None
+
+        path = self._directory / key
+
+        try:
+            image = path.read_bytes()
+            path.touch()
+            return image
+        except OSError:
+            return None
+
+    def _write_to_disk(self, key: str, image: bytes) -> None:
+        if self._directory is None:
+            return
+
+        path = self._directory / key
+        temp_path = path.with_name(path.name + ".tmp")
+
+        try:
+            temp_path.write_bytes(image)
+            temp_path.replace(path)
+        except OSError as error:
+            log_error(f"Failed to cache `{key}`: {error}")
+
+    def _evict_from_disk(self, directory: Path) -> None:
+        while len(self._disk_keys) > self._max_disk_size:
+            key, _ = self._disk_keys.popitem(last=False)
+            (directory / key).unlink(missing_ok=True)
+
+
+def render(data: str, image_format: str) -> bytes:
+    buffer = BytesIO()
+
+    if image_format == "svg":
+        make_qr_image(data, SvgPathImage).save(buffer)
+    else:
+        make_qr_image(data).save(buffer, "PNG")
+
+    return buffer.getvalue()
+
+
+def encode_resident(resident: Dict[str, Any], payload_format: str) -> str:
+    # Normalized like the generator and the booth's roster, so the codes match theirs
+    name, address, room_id = [
+        normalize_text(str(resident.get(field, "")))
+        for field in ("name", "address", "room_id")
+    ]
+    contact_number = normalize_contact_number(str(resident.get("contact_number", "")))
+
+    if name == "" or contact_number == "":
+        raise RequestError("`name` and `contact_number` are required")
+
+    if payload_format == "id":
+        id = str(resident.get("id", "")).strip()
+        data = encode_id_payload(id or roster_id(name, contact_number))
+    elif payload_format == "yaml":
+        data = encode_legacy_payload(name, address, contact_number, room_id)
+    else:
+        data = encode_payload(name, address, contact_number, room_id)
+
+    payload_size = len(data.encode())
+
+    if payload_size > MAX_PAYLOAD_SIZE:
+        raise RequestError(
+            f"Payload of {payload_size} bytes does not fit QR version "
+            f"{DEFAULT_MAX_QR_VERSION} ({MAX_PAYLOAD_SIZE} bytes)"
+        )
+
+    return data
+
+
+def parse_format(value: Any, choices: List[str]) -> str:
+    if value not in choices:
+        raise RequestError(f"Expected one of {choices}, found `{value}`")
+
+    return value
+
+
+def make_handler(cache: RenderCache, web_root: Path) -> Any:
+    class Handler(SimpleHTTPRequestHandler):
+        def __init__(self, *args: Any, **kwargs: Any):
+            super().__init__(*args, directory=str(web_root), **kwargs)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+
+            if url.path not in ("/qr.png", "/qr.svg"):
+                super().do_GET()
+                return
+
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+            try:
+                payload_format = parse_format(
+                    query.get("payload", "compact"), PAYLOAD_FORMATS
+                )
+                data = encode_resident(query, payload_format)
+            except RequestError as error:
+                self.send_error(400, str(error))
+                return
+
+            image_format = url.path.rsplit(".", 1)[1]
+            key, image = cache.get(data, image_format)
+
+            if self.headers.get("If-None-Match") == f'"{key}"':
+                self.send_response(304)
+                self.end_headers()
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPES[image_format])
+            self.send_header("Content-Length", str(len(image)))
+            self.send_header("Cache-Control", CACHE_CONTROL)
+            self.send_header("ETag", f'"{key}"')
+            self.end_headers()
+            self.wfile.write(image)
+
+        def do_POST(self):
+            if urlsplit(self.path).path != "/qr/batch":
+                self.send_error(404)
+                return
+
+            try:
+                archive = self._render_batch()
+            except RequestError as error:
+                self.send_error(400, str(error))
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/zip")
+            self.send_header("Content-Length", str(len(archive)))
+            self.send_header(
+                "Content-Disposition", 'attachment; filename="qr_codes.zip"'
+            )
+            self.end_headers()
+            self.wfile.write(archive)
+
+        def _render_batch(self) -> bytes:
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+            except ValueError:
+                length = -1
+
+            if length < 0:
+                raise RequestError("Invalid Content-Length")
+
+            if length > MAX_BODY_SIZE:
+                raise RequestError(f"Body is larger than {MAX_BODY_SIZE} bytes")
+
+            try:
+                request = json.loads(self.rfile.read(length))
+            except ValueError as error:
+                raise RequestError(f"Invalid JSON: {error}")
+
+            if not isinstance(request, dict):
+                raise RequestError("Expected a JSON object")
+
+            image_format = parse_format(
+                request.get("format", "png"), list(CONTENT_TYPES)
+            )
+            payload_format = parse_format(
+                request.get("payload", "compact"), PAYLOAD_FORMATS
+            )
+            residents = request.get("residents")
+
+            if not isinstance(residents, list) or len(residents) > MAX_BATCH_SIZE:
+                raise RequestError(
+                    f"`residents` must be a list of at most {MAX_BATCH_SIZE} objects"
+                )
+
+            buffer = BytesIO()
+            file_names: Set[str] = set()
+
+            # PNG and SVG renders are small, so storing is fast and barely larger
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+                for index, resident in enumerate(residents):
+                    if not isinstance(resident, dict):
+                        raise RequestError(f"Resident {index} is not an object")
+
+                    try:
+                        data = encode_resident(resident, payload_format)
+                    except RequestError as error:
+                        raise RequestError(f"Resident {index}: {error}")
+
+                    file_name = batch_file_name(
+                        resident, index, image_format, file_names
+                    )
+                    file_names.add(file_name)
+                    archive.writestr(file_name, cache.get(data, image_format)[1])
+
+            return buffer.getvalue()
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    return Handler
+
+
+def batch_file_name(
+    resident: Dict[str, Any], index: int, image_format: str, taken: Set[str]
+) -> str:
+    # Named like the generator's output folder, with the index to keep names unique
+    stem = re.sub(
+        FILE_NAME_FORBIDDEN,
+        "_",
+        f"{resident.get('name', '')}_{resident.get('contact_number', '')}",
+    )[:FILE_NAME_MAX_LENGTH]
+    file_name = f"{stem}.{image_format}"
+
+    if file_name in taken:
+        file_name = f"{stem}_{index}.{image_format}"
+
+    return file_name
+
+
+def main(args: Namespace) -> int:
+    cache_dir = None if args.no_disk_cache else args.cache_dir
+    cache = RenderCache(args.cache_size, cache_dir, args.disk_cache_size)
+
+    try:
+        server = ThreadingHTTPServer(
+            (args.host, args.port), make_handler(cache, args.web_root)
+        )
+    except OSError as error:
+        log_error(f"Failed to listen on {args.host}:{args.port}: {error}")
+        return 1
+
+    server.daemon_threads = True
+    log_info(f"Serving QR codes at http://{args.host}:{args.port}/")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+    log_info(
+        f"Served {cache.n_hits} codes from memory and {cache.n_disk_hits} from disk, "
+        f"rendered {cache.n_misses}"
+    )
+
+    return 0
+
+
+def parse_args() -> Namespace:
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description="Render QR codes on demand for the web page and other local clients"
+    )
+    parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on")
+    parser.add_argument(
+        "--port", type=int, default=DEFAULT_PORT, help="Port to listen on"
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_SIZE,
+        help="Number of rendered codes kept in memory",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        type=Path,
+        default=DEFAULT_CACHE_DIR,
+        help="Directory where rendered codes are kept across restarts",
+    )
+    parser.add_argument(
+        "--disk-cache-size",
+        type=int,
+        default=DEFAULT_DISK_CACHE_SIZE,
+        help="Number of rendered codes kept in the cache directory",
+    )
+    parser.add_argument(
+        "--no-disk-cache",
+        action="store_true",
+        help="Only cache rendered codes in memory",
+    )
+    parser.add_argument(
+        "--web-root",
+        type=Path,
+        default=WEB_ROOT,
+        help="Directory of the web page served at /",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    sys.exit(main(parse_args()))
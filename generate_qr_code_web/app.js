@@ -1,59 +1,57 @@
 let btn = document.querySelector(".button");
 let qr_code_element = document.querySelector(".qr-code");
 
+// Codes are rendered by generate_qr_code/server.py, which also serves this page
+function codeUrl(format, fields) {
+    return `/qr.${format}?${new URLSearchParams(fields)}`;
+}
+
+function downloadLink(text, href, file_name) {
+    let link = document.createElement("a");
+    link.setAttribute("href", href);
+    link.setAttribute("download", file_name);
+    link.className = "button";
+    link.innerText = text;
+    return link;
+}
+
 btn.addEventListener("click", () => {
-    const user_input = `
-name: ${document.querySelector("#name_input").value}
-address: ${document.querySelector("#address_input").value}
-contact_number: ${document.querySelector("#contact_number_input").value}
-room_id: ${document.querySelector("#room_id_input").value}
-`.trim()
-
-    if (user_input.value != "") {
-        if (qr_code_element.childElementCount == 0) {
-            generate(user_input);
-        } else {
-            qr_code_element.innerHTML = "";
-            generate(user_input);
-        }
-    } else {
+    const fields = {
+        name: document.querySelector("#name_input").value.trim(),
+        address: document.querySelector("#address_input").value.trim(),
+        contact_number: document.querySelector("#contact_number_input").value.trim(),
+        room_id: document.querySelector("#room_id_input").value.trim(),
+    };
+
+    qr_code_element.innerHTML = "";
+
+    if (fields.name == "" || fields.contact_number == "") {
         console.log("not valid input");
         qr_code_element.style = "display: none";
+        return;
     }
-})
 
-function generate(user_input) {
+    generate(fields);
+})
 
-    qr_code_element.style = "";
+function generate(fields) {
+    const file_name = `${fields.name}_${fields.contact_number}`;
 
-    var qrcode = new QRCode(qr_code_element, {
-        text: user_input,
-        width: 180, //128
-        height: 180,
-        colorDark: "#000000",
-        colorLight: "#ffffff",
-        correctLevel: QRCode.CorrectLevel.H
+    let qr_code_img = document.createElement("img");
+    qr_code_img.setAttribute("alt", `QR code of ${fields.name}`);
+    qr_code_img.width = 180;
+    qr_code_img.height = 180;
+    qr_code_img.addEventListener("error", () => {
+        qr_code_element.innerText = "Failed to generate the QR code";
     });
-
-    let download = document.createElement("button");
-    qr_code_element.appendChild(download);
-
-    let download_link = document.createElement("a");
-    download_link.setAttribute("download", "qr_code.png");
-    download_link.innerText = "Download";
-
-    download.appendChild(download_link);
-
-    let qr_code_img = document.querySelector(".qr-code img");
-    let qr_code_canvas = document.querySelector("canvas");
-
-    if (qr_code_img.getAttribute("src") == null) {
-        setTimeout(() => {
-            download_link.setAttribute("href", `${qr_code_canvas.toDataURL()}`);
-        }, 300);
-    } else {
-        setTimeout(() => {
-            download_link.setAttribute("href", `${qr_code_img.getAttribute("src")}`);
-        }, 300);
-    }
+    qr_code_img.setAttribute("src", codeUrl("png", fields));
+
+    qr_code_element.appendChild(qr_code_img);
+    qr_code_element.appendChild(
+        downloadLink("Download PNG", codeUrl("png", fields), `${file_name}.png`)
+    );
+    qr_code_element.appendChild(
+        downloadLink("Download SVG", codeUrl("svg", fields), `${file_name}.svg`)
+    );
+    qr_code_element.style = "";
 }